@@ -0,0 +1,139 @@
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qsl
+
+from index import EventStream, api_routes, clean_up_app
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_json(send, body, status: int) -> None:
+    payload = json.dumps(body).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def send_text(send, body: str, status: int) -> None:
+    payload = body.encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def watch_disconnect(receive, task: asyncio.Task) -> None:
+    """Cancel the task sending a stream once the client disconnects"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    task.cancel()
+
+
+async def send_stream(send, receive, stream: EventStream, status: int) -> None:
+    # A stream waiting on its producer sends nothing that would fail once the
+    # client is gone, so listen for the disconnect alongside it
+    watcher = asyncio.create_task(watch_disconnect(receive, asyncio.current_task()))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", stream.mimetype.encode()),
+                    (b"cache-control", b"no-cache"),
+                ],
+            }
+        )
+        async for chunk in stream:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except asyncio.CancelledError:
+        if not watcher.done():
+            raise
+        print("Client disconnected from event stream", file=sys.stderr)
+    finally:
+        watcher.cancel()
+        # Stops the producer, and ends the request even if it never started
+        stream.close()
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Disconnect every session and stop the shared event loops
+            clean_up_app()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point serving the same API handlers as the Flask app.
+
+    Handlers are awaited on the server's event loop and hand their Telegram
+    work to the session loops without blocking a thread, so a single worker
+    can keep many long-running requests in flight.
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    route = api_routes.get(scope["path"])
+    if route is None:
+        await send_json(send, {"success": False, "message": "Not found"}, 404)
+        return
+
+    methods, handler = route
+    if scope["method"] not in methods:
+        await send_json(send, {"success": False, "message": "Method not allowed"}, 405)
+        return
+
+    if scope["method"] == "GET":
+        data = dict(parse_qsl(scope["query_string"].decode()))
+    else:
+        try:
+            body = await read_body(receive)
+            data = json.loads(body) if body else {}
+        except ValueError:
+            await send_json(send, {"success": False, "message": "Invalid JSON"}, 400)
+            return
+
+    try:
+        body, status = await handler(data or {})
+    except Exception as e:
+        print(f"Error handling {scope['path']}: {str(e)}", file=sys.stderr)
+        body, status = {"success": False, "message": str(e)}, 500
+
+    if isinstance(body, EventStream):
+        await send_stream(send, receive, body, status)
+    elif isinstance(body, str):
+        await send_text(send, body, status)
+    else:
+        await send_json(send, body, status)
@@ -0,0 +1,640 @@
+"""Offline benchmark of the API against a fake Telegram.
+
+Swaps TelegramClient for FakeTelegramClient, whose requests are answered by
+an in-process FakeTelegram with synthetic groups, configurable latency, flood
+waits and errors, then drives /api/getParticipants, /api/inviteByPhoneNumbers
+and a background invite end to end through the Flask test client. Only the
+network is faked: Telethon's request handling, the pacer and every handler
+run as they do in production.
+
+    python bench.py --groups 3 --members 5000 --messages 3000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from telethon import TelegramClient, errors
+from telethon.tl import types
+from telethon.tl.functions.channels import (
+    GetFullChannelRequest,
+    GetParticipantsRequest,
+    InviteToChannelRequest,
+)
+from telethon.tl.functions.contacts import (
+    AddContactRequest,
+    ImportContactsRequest,
+    ResolveUsernameRequest,
+)
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.functions.updates import GetStateRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types.channels import ChannelParticipants
+from telethon.tl.types.contacts import ImportedContacts, ResolvedPeer
+from telethon.tl.types.messages import ChannelMessages, ChatFull, InvitedUsers
+
+# Requests that invite or add a user; injected errors on these are privacy
+# restrictions, which the invite loop gives up on without retrying
+INVITE_REQUESTS = (AddContactRequest, InviteToChannelRequest)
+
+# Share of the phone numbers sent to inviteByPhoneNumbers without an account
+UNKNOWN_PHONE_RATIO = 0.1
+
+SELF_ID = 1
+FIRST_USER_ID = 100_000
+FIRST_CHANNEL_ID = 1_000
+
+# Seconds each Telegram request took as seen by the API, including pacing,
+# queueing and flood waits, by request type; filled by the bench client
+rpc_latencies = {}
+
+
+class FakeTelegram:
+    """Synthetic Telegram answering the requests the API makes.
+
+    Each source group has members users, overlap of them drawn from a pool
+    shared by all groups, and messages messages sent by random members. The
+    member lists of the first hidden share of the groups are hidden, so
+    those groups are scanned through their history. Every target group
+    starts with target_members users of the shared pool.
+    """
+
+    def __init__(self, options) -> None:
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+        self.users = {}
+        self.channels = {}
+        self.channel_ids = {}
+        self.members = {}
+        self.messages = {}
+        self.hidden = set()
+
+        shared_count = round(options.members * options.overlap)
+        self.shared = [self.add_user() for _ in range(shared_count)]
+        hidden_count = round(options.groups * options.hidden)
+        for index in range(options.groups):
+            members = self.random.sample(self.shared, shared_count) + [
+                self.add_user() for _ in range(options.members - shared_count)
+            ]
+            channel_id = self.add_channel(f"bench_group_{index}", members)
+            self.messages[channel_id] = [
+                self.random.choice(members) for _ in range(options.messages)
+            ]
+            if index < hidden_count:
+                self.hidden.add(channel_id)
+        self.phones = {user.phone: user for user in self.users.values()}
+        self.handlers = {
+            AddContactRequest: self.add_contact,
+            GetFullChannelRequest: self.get_full_channel,
+            GetHistoryRequest: self.get_history,
+            GetParticipantsRequest: self.get_participants,
+            GetStateRequest: self.get_state,
+            GetUsersRequest: self.get_users,
+            ImportContactsRequest: self.import_contacts,
+            InviteToChannelRequest: self.invite_to_channel,
+            ResolveUsernameRequest: self.resolve_username,
+        }
+
+    def add_user(self) -> int:
+        user_id = FIRST_USER_ID + len(self.users)
+        roll = self.random.random()
+        if roll < 0.05:
+            status = types.UserStatusOnline(
+                expires=self.now + datetime.timedelta(minutes=5)
+            )
+        elif roll < 0.3:
+            status = types.UserStatusRecently()
+        else:
+            status = types.UserStatusOffline(
+                was_online=self.now
+                - datetime.timedelta(seconds=self.random.randrange(30 * 86400))
+            )
+        self.users[user_id] = types.User(
+            id=user_id,
+            access_hash=user_id * 31,
+            first_name=f"User{user_id}",
+            username=f"bench_user_{user_id}",
+            phone=f"1555{user_id:07d}",
+            status=status,
+        )
+        return user_id
+
+    def add_channel(self, username: str, members: list) -> int:
+        channel_id = FIRST_CHANNEL_ID + len(self.channels)
+        self.channels[channel_id] = types.Channel(
+            id=channel_id,
+            title=username,
+            photo=types.ChatPhotoEmpty(),
+            date=self.now,
+            megagroup=True,
+            access_hash=channel_id * 17,
+            username=username,
+        )
+        self.channel_ids[username] = channel_id
+        self.members[channel_id] = members
+        return channel_id
+
+    def channel_id(self, username: str):
+        channel_id = self.channel_ids.get(username)
+        if channel_id is None and username.startswith("bench_target"):
+            sample = min(self.options.target_members, len(self.shared))
+            channel_id = self.add_channel(
+                username, self.random.sample(self.shared, sample)
+            )
+        return channel_id
+
+    async def handle(self, request):
+        options = self.options
+        latency = options.latency * (
+            1 + options.jitter * (2 * self.random.random() - 1)
+        )
+        await asyncio.sleep(max(0.0, latency))
+        if self.random.random() < options.flood_rate:
+            raise errors.FloodWaitError(request, capture=options.flood_seconds)
+        if self.random.random() < options.error_rate:
+            if isinstance(request, INVITE_REQUESTS):
+                raise errors.UserPrivacyRestrictedError(request)
+            raise errors.BadRequestError(request, "BENCH_INJECTED_ERROR")
+        handler = self.handlers.get(type(request))
+        if handler is None:
+            raise errors.BadRequestError(request, "BENCH_UNSUPPORTED_REQUEST")
+        return handler(request)
+
+    def get_state(self, request):
+        return types.updates.State(pts=1, qts=0, date=self.now, seq=0, unread_count=0)
+
+    def get_users(self, request):
+        users = []
+        for input_user in request.id:
+            if isinstance(input_user, types.InputUserSelf):
+                users.append(
+                    types.User(
+                        id=SELF_ID,
+                        is_self=True,
+                        access_hash=1,
+                        first_name="Bench",
+                        phone="15550000000",
+                    )
+                )
+            elif input_user.user_id in self.users:
+                users.append(self.users[input_user.user_id])
+        return users
+
+    def resolve_username(self, request):
+        channel_id = self.channel_id(request.username)
+        if channel_id is None:
+            raise errors.UsernameNotOccupiedError(request)
+        return ResolvedPeer(
+            peer=types.PeerChannel(channel_id),
+            chats=[self.channels[channel_id]],
+            users=[],
+        )
+
+    def get_full_channel(self, request):
+        channel_id = request.channel.channel_id
+        return ChatFull(
+            full_chat=types.ChannelFull(
+                id=channel_id,
+                about="",
+                read_inbox_max_id=0,
+                read_outbox_max_id=0,
+                unread_count=0,
+                chat_photo=types.PhotoEmpty(id=0),
+                notify_settings=types.PeerNotifySettings(),
+                bot_info=[],
+                pts=1,
+                participants_count=len(self.members[channel_id]),
+            ),
+            chats=[self.channels[channel_id]],
+            users=[],
+        )
+
+    def get_participants(self, request):
+        channel_id = request.channel.channel_id
+        members = self.members[channel_id]
+        page = []
+        if channel_id not in self.hidden:
+            page = members[request.offset : request.offset + request.limit]
+        return ChannelParticipants(
+            count=len(members),
+            participants=[
+                types.ChannelParticipant(user_id=user_id, date=self.now)
+                for user_id in page
+            ],
+            chats=[],
+            users=[self.users[user_id] for user_id in page],
+        )
+
+    def get_history(self, request):
+        channel_id = request.peer.channel_id
+        senders = self.messages[channel_id]
+        top = len(senders)
+        if request.offset_id:
+            top = min(top, request.offset_id - 1)
+        top -= request.add_offset
+        bottom = max(request.min_id, top - request.limit)
+        messages = [
+            types.Message(
+                id=message_id,
+                peer_id=types.PeerChannel(channel_id),
+                date=self.now,
+                message="",
+                from_id=types.PeerUser(senders[message_id - 1]),
+            )
+            for message_id in range(top, bottom, -1)
+        ]
+        page_senders = {message.from_id.user_id for message in messages}
+        return ChannelMessages(
+            pts=1,
+            count=len(senders),
+            messages=messages,
+            topics=[],
+            chats=[self.channels[channel_id]],
+            users=[self.users[user_id] for user_id in page_senders],
+        )
+
+    def import_contacts(self, request):
+        imported = []
+        users = []
+        for contact in request.contacts:
+            user = self.phones.get(contact.phone.lstrip("+"))
+            if user is not None:
+                imported.append(
+                    types.ImportedContact(user_id=user.id, client_id=contact.client_id)
+                )
+                users.append(user)
+        return ImportedContacts(
+            imported=imported, popular_invites=[], retry_contacts=[], users=users
+        )
+
+    def add_contact(self, request):
+        return types.Updates(
+            updates=[],
+            users=[self.users[request.id.user_id]],
+            chats=[],
+            date=self.now,
+            seq=0,
+        )
+
+    def invite_to_channel(self, request):
+        channel_id = request.channel.channel_id
+        members = self.members[channel_id]
+        added = []
+        for input_user in request.users:
+            if input_user.user_id in members:
+                if len(request.users) == 1:
+                    raise errors.UserAlreadyParticipantError(request)
+                # A batch quietly leaves out users who already are members
+                continue
+            members.append(input_user.user_id)
+            added.append(input_user.user_id)
+        updates = []
+        if added:
+            # The service message announcing the new members
+            updates.append(
+                types.UpdateNewChannelMessage(
+                    message=types.MessageService(
+                        id=0,
+                        peer_id=types.PeerChannel(channel_id),
+                        date=self.now,
+                        action=types.MessageActionChatAddUser(users=added),
+                    ),
+                    pts=0,
+                    pts_count=0,
+                )
+            )
+        return InvitedUsers(
+            updates=types.Updates(
+                updates=updates, users=[], chats=[], date=self.now, seq=0
+            ),
+            missing_invitees=[],
+        )
+
+
+class FakeSender:
+    """Stands in for Telethon's MTProtoSender, handing requests to a FakeTelegram"""
+
+    def __init__(self, server: FakeTelegram) -> None:
+        self.server = server
+        self.connected = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def send(self, request, ordered=False):
+        return asyncio.ensure_future(self.server.handle(request))
+
+
+class FakeTelegramClient(TelegramClient):
+    """TelegramClient that talks to the FakeTelegram in server"""
+
+    server = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._sender = FakeSender(self.server)
+
+    async def connect(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._sender.connected = True
+
+    async def disconnect(self) -> None:
+        self._sender.connected = False
+
+
+class Sampler:
+    """Samples resident memory and thread count until stopped"""
+
+    def __init__(self, process_rss, interval=0.02) -> None:
+        self.process_rss = process_rss
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.peak_rss = max(self.peak_rss, self.process_rss() or 0)
+            # Leave out the sampler's own thread
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+
+def percentile(values, fraction: float):
+    """Nearest-rank percentile of values, or None when there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+class Stage:
+    """Timings of one benchmarked operation across all runs"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latencies = []
+        self.items = 0
+        self.elapsed = 0.0
+        self.rpc = {}
+        self.peak_rss = 0
+        self.peak_threads = 0
+
+    @contextlib.contextmanager
+    def run(self, process_rss):
+        rpc_latencies.clear()
+        with Sampler(process_rss) as sampler:
+            started = time.perf_counter()
+            yield
+            seconds = time.perf_counter() - started
+        self.latencies.append(seconds)
+        self.elapsed += seconds
+        for method, latencies in list(rpc_latencies.items()):
+            self.rpc.setdefault(method, []).extend(latencies)
+        self.peak_rss = max(self.peak_rss, sampler.peak_rss)
+        self.peak_threads = max(self.peak_threads, sampler.peak_threads)
+
+    def report(self) -> dict:
+        return {
+            "stage": self.name,
+            "runs": len(self.latencies),
+            "items": self.items,
+            "itemsPerSecond": self.items / self.elapsed if self.elapsed else None,
+            "p50": percentile(self.latencies, 0.5),
+            "p99": percentile(self.latencies, 0.99),
+            "peakRssBytes": self.peak_rss,
+            "peakThreads": self.peak_threads,
+            "rpc": {
+                method: {
+                    "count": len(latencies),
+                    "p50": percentile(latencies, 0.5),
+                    "p99": percentile(latencies, 0.99),
+                }
+                for method, latencies in sorted(self.rpc.items())
+            },
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--groups", type=int, default=3, help="source groups")
+    parser.add_argument("--members", type=int, default=2000, help="members per group")
+    parser.add_argument("--messages", type=int, default=3000, help="messages per group")
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.3,
+        help="share of each group's members drawn from a pool shared by all groups",
+    )
+    parser.add_argument(
+        "--hidden",
+        type=float,
+        default=0.34,
+        help="share of groups whose member list is hidden and scanned from history",
+    )
+    parser.add_argument(
+        "--target-members", type=int, default=200, help="members of the target group"
+    )
+    parser.add_argument(
+        "--phones", type=int, default=200, help="numbers sent to inviteByPhoneNumbers"
+    )
+    parser.add_argument(
+        "--invites", type=int, default=200, help="participants invited in background"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=5, help="background invite concurrency"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each stage")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="mean request latency in seconds"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.5, help="latency spread around the mean"
+    )
+    parser.add_argument(
+        "--flood-rate", type=float, default=0.0, help="share of requests flood waited"
+    )
+    parser.add_argument(
+        "--flood-seconds", type=int, default=1, help="length of injected flood waits"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of requests that fail"
+    )
+    parser.add_argument(
+        "--pacing",
+        action="store_true",
+        help="keep the PACING_RATES token buckets instead of only flood waits",
+    )
+    parser.add_argument(
+        "--scan-cache",
+        action="store_true",
+        help="let repeated scans reuse the history scanned by earlier runs",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument(
+        "--verbose", action="store_true", help="keep the API's log on stderr"
+    )
+    return parser.parse_args(argv)
+
+
+def run_benchmark(options) -> list:
+    # The API reads its settings on import
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="tg-bench-"))
+    import index
+
+    if not options.pacing:
+        index.PACING_RATES.clear()
+    # Injected errors are not worth waiting out
+    index.RETRY_DELAY = 0
+
+    FakeTelegramClient.server = FakeTelegram(options)
+
+    class BenchClient(index.SessionClientMixin, FakeTelegramClient):
+        async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+            started = time.perf_counter()
+            try:
+                return await super().__call__(request, ordered, flood_sleep_threshold)
+            finally:
+                rpc_latencies.setdefault(type(request).__name__, []).append(
+                    time.perf_counter() - started
+                )
+
+    index.SessionClient = BenchClient
+    client = index.app.test_client()
+    server = FakeTelegramClient.server
+    source_groups = [f"bench_group_{i}" for i in range(options.groups)]
+    phones = [
+        f"+{user.phone}" for user in list(server.users.values())[: options.phones]
+    ]
+    for i in range(round(len(phones) * UNKNOWN_PHONE_RATIO)):
+        phones[i] = f"+1666{i:07d}"
+
+    def post(path, body) -> dict:
+        response = client.post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} failed: {response.get_json()}")
+        return response.get_json()
+
+    scan = Stage("getParticipants")
+    by_phone = Stage("inviteByPhoneNumbers")
+    background = Stage("backgroundInvite")
+    for run in range(options.repeat):
+        session_id = post(
+            "/api/connect",
+            {"apiId": "1", "apiHash": "bench", "phoneNumber": "+15550000000"},
+        )["sessionId"]
+        # A new target per run, so the invite ledger and member index of
+        # earlier runs do not shrink the work
+        target_group = f"bench_target_{run}"
+
+        with scan.run(index.process_rss):
+            result = post(
+                "/api/getParticipants",
+                {
+                    "sessionId": session_id,
+                    "sourceGroups": source_groups,
+                    "targetGroup": target_group,
+                    "maxMessages": options.messages,
+                    "useScanCache": options.scan_cache,
+                    "delayRange": {"min": 0, "max": 0},
+                },
+            )
+        scan.items += sum(group["scanned"] for group in result["groups"])
+        participants = result["participants"]
+
+        with by_phone.run(index.process_rss):
+            post(
+                "/api/inviteByPhoneNumbers",
+                {
+                    "sessionId": session_id,
+                    "phoneNumbers": phones,
+                    "targetGroup": target_group,
+                    "interactive": True,
+                },
+            )
+        by_phone.items += len(phones)
+
+        invitees = participants[: options.invites]
+        if not invitees:
+            index.cleanup_session(session_id)
+            continue
+        with background.run(index.process_rss):
+            post(
+                "/api/startBackgroundInvite",
+                {
+                    "sessionId": session_id,
+                    "participants": invitees,
+                    "delayRange": {"min": 0, "max": 0},
+                    "concurrency": options.concurrency,
+                },
+            )
+            handle = index.background_tasks.get(session_id)
+            if handle is not None:
+                handle.future.result()
+        background.items += len(invitees)
+        index.cleanup_session(session_id)
+
+    index.clean_up_app()
+    return [stage.report() for stage in (scan, by_phone, background)]
+
+
+def print_report(results, file=sys.stdout) -> None:
+    def ms(seconds):
+        return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+    print(
+        f"{'stage':<24} {'runs':>4} {'items':>8} {'items/s':>9} {'p50 ms':>9}"
+        f" {'p99 ms':>9} {'peak RSS MB':>11} {'threads':>7}",
+        file=file,
+    )
+    for result in results:
+        rate = result["itemsPerSecond"]
+        print(
+            f"{result['stage']:<24} {result['runs']:>4} {result['items']:>8}"
+            f" {'-' if rate is None else f'{rate:.1f}':>9}"
+            f" {ms(result['p50']):>9} {ms(result['p99']):>9}"
+            f" {result['peakRssBytes'] / 2**20:>11.1f} {result['peakThreads']:>7}",
+            file=file,
+        )
+        for method, rpc in result["rpc"].items():
+            print(
+                f"  {method:<30} {rpc['count']:>8} {'':>9}"
+                f" {ms(rpc['p50']):>9} {ms(rpc['p99']):>9}",
+                file=file,
+            )
+
+
+def main(argv=None) -> None:
+    options = parse_args(argv)
+    if options.verbose:
+        results = run_benchmark(options)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+            results = run_benchmark(options)
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
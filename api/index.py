@@ -1,18 +1,68 @@
 import asyncio
 import concurrent.futures
+import datetime
+import hashlib
+import hmac
+import json
+import math
+import os
 import random
+import secrets
+import sqlite3
 import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextvars import ContextVar
 from functools import wraps
-from threading import Thread
-
-from flask import Flask, jsonify, request
-from telethon import TelegramClient
-from telethon.errors import ChatAdminRequiredError
+from threading import Lock, Thread, active_count, local
+
+from flask import Flask, Response, jsonify, request
+from telethon import TelegramClient, utils
+from telethon.crypto import AESModeCTR
+from telethon.errors import (
+    BotGroupsBlockedError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    ChatWriteForbiddenError,
+    FloodError,
+    FloodWaitError,
+    InputUserDeactivatedError,
+    PeerFloodError,
+    PeerIdInvalidError,
+    UserAlreadyParticipantError,
+    UserBannedInChannelError,
+    UserBotError,
+    UserChannelsTooMuchError,
+    UserIdInvalidError,
+    UserKickedError,
+    UserNotMutualContactError,
+    UserPrivacyRestrictedError,
+    UsersTooMuchError,
+)
 from telethon.sessions import StringSession
 from telethon.tl.functions.channels import GetFullChannelRequest, InviteToChannelRequest
-from telethon.tl.functions.contacts import AddContactRequest
+from telethon.tl.functions.contacts import AddContactRequest, ImportContactsRequest
 from telethon.tl.functions.messages import AddChatUserRequest, GetHistoryRequest
-from telethon.tl.types import ChannelParticipantsSearch, InputPeerChannel, InputPeerChat
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types import (
+    ChannelParticipantsSearch,
+    InputPeerChannel,
+    InputPeerChat,
+    InputPeerUser,
+    InputPhoneContact,
+    MessageActionChatAddUser,
+    UpdateChannelParticipant,
+    User,
+    UserStatusEmpty,
+    UserStatusLastMonth,
+    UserStatusLastWeek,
+    UserStatusOffline,
+    UserStatusOnline,
+    UserStatusRecently,
+)
 
 app = Flask(__name__)
 
@@ -23,86 +73,1191 @@ active_tasks = {}
 # Store background tasks
 background_tasks = {}
 
-# Store event loops and threads for each session
+# Number of requests each session has in flight, streams included
+session_requests = {}
+session_requests_lock = Lock()
+
+# Pin each session to one of the shared event loops
 session_event_loops = {}
-session_threads = {}
 
-# Create and set a single event loop for the application
-main_loop = asyncio.new_event_loop()
-asyncio.set_event_loop(main_loop)
+# Number of event-loop threads shared by all sessions (defaults to one per core)
+LOOP_POOL_SIZE = int(os.environ.get("LOOP_POOL_SIZE", os.cpu_count() or 1))
+
+# Seconds a session may go unused before it is disconnected, the most
+# sessions kept connected, and the resident memory in MB above which idle
+# sessions are evicted (0 turns a limit off)
+SESSION_IDLE_TTL = int(os.environ.get("SESSION_IDLE_TTL", 1800))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 0))
+MAX_MEMORY_MB = int(os.environ.get("MAX_MEMORY_MB", 0))
+REAPER_INTERVAL = 60
+
+# Maximum number of events buffered for a streaming response
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", 256))
+
+# Users resolved per GetUsersRequest when a message sender is not in the history page
+GET_USERS_BATCH_SIZE = 100
+
+# Phone numbers packed into one ImportContactsRequest
+IMPORT_CONTACTS_BATCH_SIZE = int(os.environ.get("IMPORT_CONTACTS_BATCH_SIZE", 100))
+
+# Times the numbers Telegram answers with retry_contacts are imported again
+IMPORT_CONTACTS_RETRIES = 2
+
+# Largest number of users invited with one InviteToChannelRequest
+MAX_INVITE_BATCH_SIZE = 50
+
+# Participants a background invite works on at once, and the largest
+# concurrency a request may ask for
+INVITE_CONCURRENCY = int(os.environ.get("INVITE_CONCURRENCY", 5))
+MAX_INVITE_CONCURRENCY = 20
+
+# Longest flood wait in seconds sat out transparently during an interactive
+# request, and during a background invite; longer waits raise instead
+MAX_FLOOD_WAIT = int(os.environ.get("MAX_FLOOD_WAIT", 60))
+BACKGROUND_MAX_FLOOD_WAIT = int(os.environ.get("BACKGROUND_MAX_FLOOD_WAIT", 6 * 3600))
+
+# Token bucket (requests per second, burst) per request type, overridable with
+# a JSON object in PACING_RATES; other request types are only paced by flood waits
+PACING_RATES = {
+    "AddContactRequest": (0.5, 5),
+    "GetParticipantsRequest": (2, 10),
+    "GetUsersRequest": (2, 10),
+    "ImportContactsRequest": (0.5, 2),
+    "InviteToChannelRequest": (0.5, 5),
+    "ResolveUsernameRequest": (0.5, 5),
+}
+PACING_RATES.update(json.loads(os.environ.get("PACING_RATES", "{}")))
+
+# Telegram requests a session keeps in flight at once, in total (0 for no
+# limit) and per request type, overridable with a JSON object in
+# RPC_METHOD_CONCURRENCY; requests over a limit queue until a slot frees up
+RPC_CONCURRENCY = int(os.environ.get("RPC_CONCURRENCY", 8))
+RPC_METHOD_CONCURRENCY = {
+    "AddContactRequest": 2,
+    "GetHistoryRequest": 2,
+    "GetParticipantsRequest": 2,
+    "GetUsersRequest": 2,
+    "ImportContactsRequest": 1,
+    "InviteToChannelRequest": 2,
+}
+RPC_METHOD_CONCURRENCY.update(
+    json.loads(os.environ.get("RPC_METHOD_CONCURRENCY", "{}"))
+)
+
+# Seconds to wait before retrying a failed invite step
+RETRY_DELAY = 30
+
+# Seconds the clients get to disconnect when the app shuts down
+DISCONNECT_TIMEOUT = 5
+
+# Upper bounds in seconds of the Telegram request latency histogram buckets,
+# and seconds between event loop lag samples
+RPC_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LOOP_LAG_INTERVAL = 1
+
+# State changes kept per invite job for pollers and streams, finished jobs
+# kept for status queries, and seconds between progress events of a stream
+JOB_EVENT_BUFFER = int(os.environ.get("JOB_EVENT_BUFFER", 256))
+JOB_HISTORY_SIZE = int(os.environ.get("JOB_HISTORY_SIZE", 50))
+JOB_PROGRESS_INTERVAL = 1
+
+# Seconds invites are held back after Telegram flags the account for spam
+PEER_FLOOD_DELAY = int(os.environ.get("PEER_FLOOD_DELAY", 3600))
+
+# Participants scanned between progress events of a streaming scan
+PROGRESS_INTERVAL = 500
+
+# Seconds before a target's member index is topped up with its most recent members,
+# and before it is reloaded in full to drop members who left
+MEMBERSHIP_REFRESH_TTL = int(os.environ.get("MEMBERSHIP_REFRESH_TTL", 300))
+MEMBERSHIP_RELOAD_TTL = int(os.environ.get("MEMBERSHIP_RELOAD_TTL", 6 * 3600))
+
+# Recent members fetched when topping up a member index
+MEMBERSHIP_REFRESH_LIMIT = 200
+
+# Size and lifetime in seconds of the shared cache of resolved group links
+ENTITY_CACHE_SIZE = int(os.environ.get("ENTITY_CACHE_SIZE", 1024))
+ENTITY_CACHE_TTL = int(os.environ.get("ENTITY_CACHE_TTL", 24 * 3600))
+
+# Seconds a history scan checkpoint is reused before its group is scanned
+# afresh, so cached statuses never get older than that, and the most senders
+# cached per group before the checkpoint is dropped
+SCAN_CACHE_TTL = int(os.environ.get("SCAN_CACHE_TTL", 7 * 24 * 3600))
+SCAN_CACHE_MAX_SENDERS = int(os.environ.get("SCAN_CACHE_MAX_SENDERS", 100_000))
+
+# Secret that enables the encrypted store of logged-in sessions, so reconnecting
+# reuses the auth key instead of logging in again
+SESSION_STORE_KEY = os.environ.get("SESSION_STORE_KEY")
+
+# Directory of the local SQLite database for state that outlives a session
+DATA_DIR = os.environ.get(
+    "DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+)
+DB_PATH = os.path.join(DATA_DIR, "tg_bulk_invite.db")
+
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_checkpoints (
+    account_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    max_message_id INTEGER NOT NULL,
+    min_message_id INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account_id, group_id)
+);
+CREATE TABLE IF NOT EXISTS history_senders (
+    account_id INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    access_hash INTEGER,
+    first_name TEXT,
+    last_name TEXT,
+    username TEXT,
+    phone TEXT,
+    status TEXT,
+    status_time REAL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (account_id, group_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS invite_ledger (
+    target_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT,
+    error_kind TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (target_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS invite_jobs (
+    job_id TEXT PRIMARY KEY,
+    account_id INTEGER NOT NULL,
+    target_type TEXT NOT NULL,
+    target_id INTEGER NOT NULL,
+    target_hash INTEGER,
+    settings TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invite_job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    user_id INTEGER,
+    access_hash INTEGER,
+    first_name TEXT,
+    last_name TEXT,
+    username TEXT,
+    phone TEXT,
+    state INTEGER NOT NULL,
+    reason INTEGER NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS account_sessions (
+    account_id INTEGER PRIMARY KEY,
+    nonce BLOB NOT NULL,
+    ciphertext BLOB NOT NULL,
+    mac BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+db_local = local()
+
+# Flood waits the current task sits out before giving up with the error
+max_flood_wait = ContextVar("max_flood_wait", default=MAX_FLOOD_WAIT)
+
+# Member indexes of target groups, keyed by peer ID and shared by all sessions
+membership_indexes = {}
+membership_lock = Lock()
+
+# Handlers shared by the Flask (WSGI) app and the ASGI entry point in asgi.py
+api_routes = {}
+
+
+class Metrics:
+    """Process-wide counters served by /api/metrics in the Prometheus text format.
+
+    Recording is a dict lookup, a bisect and a few additions under an
+    uncontended lock, cheap enough to run on every Telegram request.
+    Gauges such as session and thread counts are read when scraped.
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.rpc_latency = {}  # method -> [count per bucket..., +Inf, sum]
+        self.rpc_errors = {}  # (method, kind) -> count
+        self.flood_waits = {}  # method -> [count, seconds]
+        self.loop_lag = {}  # loop name -> seconds
+        self.invites = {}  # final state -> count
+        self.evictions = {}  # reason -> count
+
+    def observe_rpc(self, method: str, seconds: float, error=None) -> None:
+        with self.lock:
+            histogram = self.rpc_latency.get(method)
+            if histogram is None:
+                histogram = self.rpc_latency[method] = [0] * (
+                    len(RPC_LATENCY_BUCKETS) + 2
+                )
+            histogram[bisect_left(RPC_LATENCY_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+            if error is not None:
+                key = (method, classify_error(error))
+                self.rpc_errors[key] = self.rpc_errors.get(key, 0) + 1
+
+    def observe_flood_wait(self, method: str, seconds: float) -> None:
+        with self.lock:
+            waits = self.flood_waits.setdefault(method, [0, 0])
+            waits[0] += 1
+            waits[1] += seconds
+
+    def observe_invite(self, state: str) -> None:
+        with self.lock:
+            self.invites[state] = self.invites.get(state, 0) + 1
+
+    def observe_eviction(self, reason: str) -> None:
+        with self.lock:
+            self.evictions[reason] = self.evictions.get(reason, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(
+                    f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}"
+                )
 
+        with self.lock:
+            latency = {method: list(h) for method, h in self.rpc_latency.items()}
+            errors = dict(self.rpc_errors)
+            flood_waits = {method: list(w) for method, w in self.flood_waits.items()}
+            loop_lag = dict(self.loop_lag)
+            invites = dict(self.invites)
+            evictions = dict(self.evictions)
+
+        lines.append("# HELP tg_rpc_duration_seconds Telegram request latency")
+        lines.append("# TYPE tg_rpc_duration_seconds histogram")
+        for method, histogram in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(RPC_LATENCY_BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(
+                    f'tg_rpc_duration_seconds_bucket{{method="{method}",le="{bound}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(
+                f'tg_rpc_duration_seconds_sum{{method="{method}"}} {histogram[-1]}'
+            )
+            lines.append(
+                f'tg_rpc_duration_seconds_count{{method="{method}"}} {cumulative}'
+            )
 
-def start_background_loop(loop: asyncio.AbstractEventLoop, session_id: str) -> None:
-    """Start a background loop for a specific session"""
+        metric(
+            "tg_rpc_errors_total",
+            "counter",
+            "Failed Telegram requests by error class",
+            [
+                ((("method", method), ("kind", kind)), count)
+                for (method, kind), count in sorted(errors.items())
+            ],
+        )
+        metric(
+            "tg_flood_waits_total",
+            "counter",
+            "Flood waits Telegram asked for",
+            [((("method", m),), w[0]) for m, w in sorted(flood_waits.items())],
+        )
+        metric(
+            "tg_flood_wait_seconds_total",
+            "counter",
+            "Seconds of flood wait Telegram asked for",
+            [((("method", m),), w[1]) for m, w in sorted(flood_waits.items())],
+        )
+        metric(
+            "tg_rpc_waiting",
+            "gauge",
+            "Requests waiting for their pacing token bucket",
+            sorted(rpc_waiting().items()),
+        )
+        in_flight, queued, client_queued = rpc_concurrency()
+        metric(
+            "tg_rpc_in_flight",
+            "gauge",
+            "Requests holding a slot of their type, including pacing and flood waits",
+            sorted(in_flight.items()),
+        )
+        metric(
+            "tg_rpc_queued",
+            "gauge",
+            "Requests waiting for a free slot of their type",
+            sorted(queued.items()),
+        )
+        metric(
+            "tg_rpc_session_queued",
+            "gauge",
+            "Requests waiting for a free slot of their session's in-flight limit",
+            [((), client_queued)],
+        )
+        metric(
+            "tg_event_loop_lag_seconds",
+            "gauge",
+            "How late the last timer of each session loop fired",
+            [((("loop", name),), lag) for name, lag in sorted(loop_lag.items())],
+        )
+        metric(
+            "tg_active_sessions",
+            "gauge",
+            "Connected Telegram sessions",
+            [((), len(active_clients))],
+        )
+        metric("tg_threads", "gauge", "Threads in this process", [((), active_count())])
+        metric(
+            "tg_sessions_evicted_total",
+            "counter",
+            "Sessions disconnected by the reaper by reason",
+            [((("reason", r),), n) for r, n in sorted(evictions.items())],
+        )
+        rss = process_rss()
+        if rss is not None:
+            metric(
+                "tg_process_resident_bytes",
+                "gauge",
+                "Resident memory of this process",
+                [((), rss)],
+            )
+        metric(
+            "tg_invite_jobs",
+            "gauge",
+            "Background invite jobs kept in memory by status",
+            [
+                ((("status", s),), n)
+                for s, n in sorted(invite_jobs.status_counts().items())
+            ],
+        )
+        metric(
+            "tg_invites_total",
+            "counter",
+            "Participants that reached a final state; rate() gives invite throughput",
+            [((("state", state),), n) for state, n in sorted(invites.items())],
+        )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def start_background_loop(loop: asyncio.AbstractEventLoop, name: str) -> None:
+    """Run a pool event loop until it is stopped"""
     try:
         asyncio.set_event_loop(loop)
         loop.run_forever()
     except Exception as e:
         print(
-            f"Error in background loop for session {session_id}: {str(e)}",
+            f"Error in background loop {name}: {str(e)}",
             file=sys.stderr,
         )
     finally:
-        print(f"Background loop for session {session_id} has stopped", file=sys.stderr)
+        print(f"Background loop {name} has stopped", file=sys.stderr)
 
 
-def create_session_thread(session_id: str) -> None:
-    """Create a new thread with its own event loop for a session"""
-    if session_id in session_threads and session_threads[session_id].is_alive():
-        print(f"Thread for session {session_id} already exists", file=sys.stderr)
-        return
+async def cancel_loop_tasks() -> None:
+    """Cancel every other task on the running loop and wait for them to end"""
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
-    # Create a new event loop for this session
-    loop = asyncio.new_event_loop()
-    session_event_loops[session_id] = loop
 
-    # Create and start a thread for this session
-    thread = Thread(target=start_background_loop, args=(loop, session_id), daemon=True)
-    session_threads[session_id] = thread
-    thread.start()
+async def monitor_loop_lag(name: str) -> None:
+    """Record how late a sleep on this loop wakes up, as a measure of its load"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.loop_lag[name] = max(0.0, loop.time() - started - LOOP_LAG_INTERVAL)
 
-    print(
-        f"Created new thread and event loop for session {session_id}", file=sys.stderr
-    )
 
+class LoopPool:
+    """A fixed set of event-loop threads that all sessions are multiplexed onto.
 
-def cleanup_session(session_id: str) -> None:
-    """Clean up resources for a session"""
-    try:
-        # Stop the event loop
-        if session_id in session_event_loops:
-            loop = session_event_loops[session_id]
+    Sessions are pinned to a loop by a stable hash of their ID, so a session's
+    client and tasks always live on the same loop while the thread count stays
+    constant no matter how many sessions are connected.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self.loops = []
+        self.threads = []
+        self._lock = Lock()
+
+    def start(self) -> None:
+        # Started lazily so that forked gunicorn workers get their own threads
+        with self._lock:
+            if self.loops:
+                return
+            for index in range(self.size):
+                loop = asyncio.new_event_loop()
+                thread = Thread(
+                    target=start_background_loop,
+                    args=(loop, f"pool-{index}"),
+                    name=f"session-loop-{index}",
+                    daemon=True,
+                )
+                self.loops.append(loop)
+                self.threads.append(thread)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(
+                    monitor_loop_lag(f"pool-{index}"), loop
+                )
+            asyncio.run_coroutine_threadsafe(reap_idle_sessions(), self.loops[0])
+            print(f"Started {self.size} session event loops", file=sys.stderr)
+
+    def loop_for(self, session_id: str) -> asyncio.AbstractEventLoop:
+        """Return the loop a session is pinned to"""
+        self.start()
+        return self.loops[zlib.crc32(str(session_id).encode()) % self.size]
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Cancel the tasks left on every loop, then stop it and join its thread.
+
+        This also ends the pool's own lag monitors and idle reaper, which
+        would otherwise be destroyed while still pending.
+        """
+        with self._lock:
+            loops, threads = self.loops, self.threads
+            self.loops, self.threads = [], []
+        concurrent.futures.wait(
+            [
+                asyncio.run_coroutine_threadsafe(cancel_loop_tasks(), loop)
+                for loop in loops
+            ],
+            timeout,
+        )
+        for loop in loops:
             loop.call_soon_threadsafe(loop.stop)
-            print(f"Stopped event loop for session {session_id}", file=sys.stderr)
-            del session_event_loops[session_id]
+        for loop, thread in zip(loops, threads):
+            thread.join(timeout)
+            if not thread.is_alive():
+                loop.close()
 
-        # Remove thread reference
-        if session_id in session_threads:
-            print(f"Removed thread reference for session {session_id}", file=sys.stderr)
-            del session_threads[session_id]
 
-        # Clean up client
-        if session_id in active_clients:
-            print(f"Removed client reference for session {session_id}", file=sys.stderr)
-            del active_clients[session_id]
+loop_pool = LoopPool(LOOP_POOL_SIZE)
 
-        # Clean up background task
-        if session_id in background_tasks:
+
+def get_session_loop(session_id: str) -> asyncio.AbstractEventLoop:
+    """Return the shared event loop a session is pinned to"""
+    loop = session_event_loops.get(session_id)
+    if loop is None or loop.is_closed():
+        loop = loop_pool.loop_for(session_id)
+        session_event_loops[session_id] = loop
+    return loop
+
+
+def cleanup_session(session_id: str):
+    """Clean up resources for a session.
+
+    Returns the concurrent future of the client's disconnect, or None. It may
+    be called from the session's own loop, so it does not wait for it.
+    """
+    disconnect = None
+    try:
+        loop = session_event_loops.pop(session_id, None)
+
+        # Disconnect the client on the loop it was created on; the loop itself
+        # is shared with other sessions and keeps running
+        client_info = active_clients.pop(session_id, None)
+        if client_info is not None:
+            client = client_info.get("client")
+            if client is not None and loop is not None and not loop.is_closed():
+                disconnect = asyncio.run_coroutine_threadsafe(client.disconnect(), loop)
+            print(f"Disconnected client for session {session_id}", file=sys.stderr)
+
+        # Stop the background task, which no longer has a client to use
+        handle = background_tasks.pop(session_id, None)
+        if handle is not None:
+            handle.cancel()
             print(
-                f"Removed background task reference for session {session_id}",
+                f"Stopped background task for session {session_id}",
                 file=sys.stderr,
             )
-            del background_tasks[session_id]
     except Exception as e:
         print(f"Error cleaning up session {session_id}: {str(e)}", file=sys.stderr)
+    return disconnect
+
+
+def touch_session(session_id) -> None:
+    client_info = active_clients.get(session_id)
+    if client_info is not None:
+        client_info["last_used"] = time.monotonic()
+
+
+def hold_session(session_id):
+    """Count a request as in flight on the session until the returned
+    function is called. The reaper never evicts a session with one."""
+    if not session_id:
+        return lambda: None
+    with session_requests_lock:
+        session_requests[session_id] = session_requests.get(session_id, 0) + 1
+    released = False
+
+    def release():
+        nonlocal released
+        with session_requests_lock:
+            if released:
+                return
+            released = True
+            if session_requests[session_id] > 1:
+                session_requests[session_id] -= 1
+            else:
+                del session_requests[session_id]
+        touch_session(session_id)
+
+    return release
+
+
+def process_rss():
+    """Return this process's resident memory in bytes, or None off Linux"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def approx_size(obj, seen=None) -> int:
+    """Roughly how many bytes obj and the containers and strings in it use"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_size(key, seen) + approx_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approx_size(item, seen)
+    else:
+        for name in getattr(type(obj), "__slots__", ()):
+            size += approx_size(getattr(obj, name, None), seen)
+    return size
+
+
+def session_memory(client_info) -> int:
+    """Estimate the memory a session holds in its client's entity cache"""
+    session = getattr(client_info.get("client"), "session", None)
+    return approx_size(getattr(session, "_entities", ()))
+
+
+def reap_sessions(reserve: int = 0) -> list:
+    """Disconnect the sessions that are idle too long or over the limits.
+
+    Sessions running a background invite or with a request in flight are
+    never evicted. Beyond the idle
+    TTL, the least recently used sessions go first until there is room for
+    reserve more sessions under MAX_SESSIONS, and until their estimated
+    memory covers what the process uses above MAX_MEMORY_MB. Returns the
+    (session ID, reason) pairs evicted.
+    """
+    now = time.monotonic()
+    idle = sorted(
+        (
+            (client_info.get("last_used", 0), session_id, client_info)
+            for session_id, client_info in list(active_clients.items())
+            if session_id not in background_tasks and session_id not in session_requests
+        ),
+        key=lambda entry: entry[0],
+    )
+    evicted = []
+
+    def evict(reason):
+        _, session_id, _ = idle.pop(0)
+        with session_requests_lock:
+            if session_id in session_requests:
+                # A request came in since the sessions were listed
+                return
+        cleanup_session(session_id)
+        metrics.observe_eviction(reason)
+        evicted.append((session_id, reason))
+
+    while idle and now - idle[0][0] > SESSION_IDLE_TTL:
+        evict("idle")
+    while idle and MAX_SESSIONS and len(active_clients) + reserve > MAX_SESSIONS:
+        evict("session_cap")
+    rss = process_rss()
+    if MAX_MEMORY_MB and rss is not None:
+        excess = rss - MAX_MEMORY_MB * 1024 * 1024
+        while idle and excess > 0:
+            excess -= session_memory(idle[0][2])
+            evict("memory_cap")
+
+    for session_id, reason in evicted:
+        print(f"Evicted session {session_id} ({reason})", file=sys.stderr)
+    return evicted
+
+
+async def reap_idle_sessions() -> None:
+    """Run reap_sessions every REAPER_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            reap_sessions()
+        except Exception as e:
+            print(f"Error reaping sessions: {str(e)}", file=sys.stderr)
+
+
+class EventStream:
+    """A stream of JSON events produced by a coroutine on a session loop.
+
+    The producer pushes events into a bounded queue, so a slow reader applies
+    back-pressure instead of the whole result being held in memory. Events are
+    encoded as NDJSON lines or Server-Sent Events.
+    """
+
+    MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+    def __init__(self, loop, produce, stream_format="ndjson") -> None:
+        self.loop = loop
+        self.produce = produce
+        self.format = stream_format
+        self.mimetype = self.MIMETYPES[stream_format]
+        self.queue = None
+        self.task = None
+        # Set by api_route to end the request once the stream is closed
+        self.release = None
+
+    async def _start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=STREAM_BUFFER_SIZE)
+
+        async def run():
+            try:
+                await self.produce(self.queue.put)
+            except Exception as e:
+                print(f"Error in event stream: {str(e)}", file=sys.stderr)
+                await self.queue.put({"type": "error", "message": str(e)})
+            # End of stream marker
+            await self.queue.put(None)
+
+        self.task = asyncio.create_task(run())
+
+    async def _next_batch(self) -> list:
+        # Wait for one event, then take whatever else is already buffered
+        batch = [await self.queue.get()]
+        while batch[-1] is not None and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    def encode(self, batch: list) -> bytes:
+        if self.format == "sse":
+            lines = (
+                f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                for event in batch
+                if event is not None
+            )
+        else:
+            lines = (json.dumps(event) + "\n" for event in batch if event is not None)
+        return "".join(lines).encode()
+
+    def close(self) -> None:
+        """Stop the producer if the reader went away before the end"""
+        if self.task is not None and not self.task.done():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        if self.release is not None:
+            self.release()
+
+    async def __aiter__(self):
+        await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._start(), self.loop)
+        )
+        try:
+            while True:
+                batch = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(self._next_batch(), self.loop)
+                )
+                yield self.encode(batch)
+                if batch[-1] is None:
+                    return
+        finally:
+            self.close()
+
+    def __iter__(self):
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        try:
+            while True:
+                batch = asyncio.run_coroutine_threadsafe(
+                    self._next_batch(), self.loop
+                ).result()
+                yield self.encode(batch)
+                if batch[-1] is None:
+                    return
+        finally:
+            self.close()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at", "blocked_until", "waiting")
+
+    def __init__(self, rate=None, burst=1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+
+
+class ConcurrencyLimit:
+    """Lets at most limit requests in at once, or any number if limit is None,
+    and counts those in flight and those queued for a slot."""
+
+    __slots__ = ("limit", "semaphore", "in_flight", "waiting")
+
+    def __init__(self, limit=None) -> None:
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def __aenter__(self) -> None:
+        if self.semaphore is not None:
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.in_flight -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+class PacingScheduler:
+    """Paces the Telegram requests of one session.
+
+    Each request type has a token bucket from PACING_RATES. When Telegram
+    answers with a flood or slow-mode wait, that request type is blocked for
+    exactly the number of seconds it asked for, so every caller pauses
+    together instead of each one hitting the limit again. A block longer than
+    max_flood_wait raises FloodWaitError right away rather than sleeping.
+
+    How many requests are in flight at once is bounded too, per request type
+    by RPC_METHOD_CONCURRENCY and for the whole session by RPC_CONCURRENCY.
+    """
+
+    def __init__(
+        self,
+        rates=PACING_RATES,
+        concurrency=RPC_CONCURRENCY,
+        method_concurrency=RPC_METHOD_CONCURRENCY,
+    ) -> None:
+        self.rates = rates
+        self.buckets = {}
+        self.method_concurrency = method_concurrency
+        self.limits = {}
+        self.in_flight = ConcurrencyLimit(concurrency or None)
+
+    def limit(self, method: str) -> ConcurrencyLimit:
+        limit = self.limits.get(method)
+        if limit is None:
+            limit = self.limits[method] = ConcurrencyLimit(
+                self.method_concurrency.get(method)
+            )
+        return limit
+
+    def bucket(self, method: str) -> TokenBucket:
+        bucket = self.buckets.get(method)
+        if bucket is None:
+            rate, burst = self.rates.get(method, (None, 1))
+            bucket = self.buckets[method] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, method: str, request=None) -> None:
+        bucket = self.bucket(method)
+        while True:
+            now = time.monotonic()
+            if bucket.blocked_until > now:
+                delay = bucket.blocked_until - now
+                if delay > max_flood_wait.get():
+                    # Fail fast, as the flood wait behind the block did
+                    raise FloodWaitError(request, capture=math.ceil(delay))
+            elif bucket.rate is None:
+                return
+            else:
+                bucket.tokens = min(
+                    bucket.burst,
+                    bucket.tokens + (now - bucket.updated_at) * bucket.rate,
+                )
+                bucket.updated_at = now
+                if bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                delay = (1 - bucket.tokens) / bucket.rate
+            bucket.waiting += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                bucket.waiting -= 1
+
+    def block(self, method: str, seconds: float) -> None:
+        bucket = self.bucket(method)
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+
+class SessionClientMixin:
+    """Runs every request of a session's client through its PacingScheduler.
+
+    A request first takes a slot of its type, then a pacing token, then a
+    slot of the session's in-flight limit, so requests held back by their
+    pacing or a flood wait never keep other types from running. Flood waits
+    up to max_flood_wait are sat out and the request is sent again;
+    Telethon's own flood sleeping is turned off so that every wait goes
+    through the scheduler.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.flood_sleep_threshold = 0
+        self.pacer = PacingScheduler()
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        method = type(request).__name__
+        async with self.pacer.limit(method):
+            while True:
+                await self.pacer.acquire(method, request)
+                async with self.pacer.in_flight:
+                    started = time.perf_counter()
+                    try:
+                        result = await super().__call__(
+                            request, ordered, flood_sleep_threshold
+                        )
+                    except FloodError as e:
+                        metrics.observe_rpc(method, time.perf_counter() - started, e)
+                        seconds = getattr(e, "seconds", None)
+                        if seconds is None:
+                            raise
+                        metrics.observe_flood_wait(method, seconds)
+                        self.pacer.block(method, seconds)
+                        if seconds > max_flood_wait.get():
+                            raise
+                    except Exception as e:
+                        metrics.observe_rpc(method, time.perf_counter() - started, e)
+                        raise
+                    else:
+                        metrics.observe_rpc(method, time.perf_counter() - started)
+                        return result
+                print(f"Waiting {seconds}s for {method} flood wait", file=sys.stderr)
+
+
+class SessionClient(SessionClientMixin, TelegramClient):
+    pass
+
+
+def rpc_waiting() -> dict:
+    """Count the requests of all sessions waiting on their pacers, by type"""
+    waiting = {}
+    for client_info in list(active_clients.values()):
+        pacer = getattr(client_info.get("client"), "pacer", None)
+        if pacer is None:
+            continue
+        for method, bucket in list(pacer.buckets.items()):
+            if bucket.waiting:
+                key = (("method", method),)
+                waiting[key] = waiting.get(key, 0) + bucket.waiting
+    return waiting
+
+
+def rpc_concurrency() -> tuple:
+    """Count the requests of all sessions in flight and queued for a slot of
+    their type, by type, and those queued for their session's in-flight limit"""
+    in_flight = {}
+    queued = {}
+    client_queued = 0
+    for client_info in list(active_clients.values()):
+        pacer = getattr(client_info.get("client"), "pacer", None)
+        if pacer is None:
+            continue
+        client_queued += pacer.in_flight.waiting
+        for method, limit in list(pacer.limits.items()):
+            key = (("method", method),)
+            if limit.in_flight:
+                in_flight[key] = in_flight.get(key, 0) + limit.in_flight
+            if limit.waiting:
+                queued[key] = queued.get(key, 0) + limit.waiting
+    return in_flight, queued, client_queued
+
+
+def get_db() -> sqlite3.Connection:
+    """Return this thread's connection to the local database"""
+    conn = getattr(db_local, "conn", None)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(DB_SCHEMA)
+        db_local.conn = conn
+    return conn
+
+
+async def get_account_id(session_id: str, client) -> int:
+    """Return the Telegram user ID the session is logged in as"""
+    client_info = active_clients[session_id]
+    if "account_id" not in client_info:
+        me = await client.get_me(input_peer=True)
+        client_info["account_id"] = me.user_id
+    return client_info["account_id"]
+
+
+class SessionStore:
+    """Encrypted Telegram sessions saved per account in the local database.
+
+    Session strings hold the account's auth key, so they are encrypted with
+    AES-CTR and authenticated with HMAC-SHA256 under keys derived from both
+    SESSION_STORE_KEY and a resume token that only the client who logged in
+    is given. The token names the Telegram user ID the session is saved
+    under; without it the session cannot be decrypted, and a wrong token
+    fails authentication.
+    """
+
+    def __init__(self, secret: str) -> None:
+        self.key = hashlib.pbkdf2_hmac(
+            "sha256", secret.encode(), b"tg-bulk-invite-sessions", 200_000
+        )
+
+    @staticmethod
+    def new_token(account_id: int) -> str:
+        return f"{account_id}.{secrets.token_urlsafe(32)}"
+
+    @staticmethod
+    def token_account(token):
+        """Return the user ID a resume token names, or None if malformed"""
+        account, _, secret = str(token or "").partition(".")
+        if not account.isdigit() or not secret:
+            return None
+        return int(account)
+
+    def keys(self, token: str) -> tuple:
+        key = hmac.new(self.key, token.encode(), hashlib.sha512).digest()
+        return key[:32], key[32:]
+
+    @staticmethod
+    def sign(mac_key: bytes, account_id: int, nonce: bytes, ciphertext: bytes):
+        return hmac.new(
+            mac_key, str(account_id).encode() + nonce + ciphertext, hashlib.sha256
+        ).digest()
+
+    def load(self, token):
+        """Return the saved session string the resume token unlocks, if any"""
+        account_id = self.token_account(token)
+        if account_id is None:
+            return None
+        row = (
+            get_db()
+            .execute(
+                "SELECT nonce, ciphertext, mac FROM account_sessions"
+                " WHERE account_id = ?",
+                (account_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        nonce, ciphertext, mac = row
+        cipher_key, mac_key = self.keys(token)
+        if not hmac.compare_digest(
+            mac, self.sign(mac_key, account_id, nonce, ciphertext)
+        ):
+            print(
+                f"Ignoring session of {account_id}: wrong resume token",
+                file=sys.stderr,
+            )
+            return None
+        return AESModeCTR(cipher_key, nonce).decrypt(ciphertext).decode()
+
+    def save(self, token: str, session_string: str) -> None:
+        """Save a session under the account its token names, replacing the
+        account's earlier session and with it the earlier token"""
+        account_id = self.token_account(token)
+        cipher_key, mac_key = self.keys(token)
+        nonce = os.urandom(16)
+        ciphertext = AESModeCTR(cipher_key, nonce).encrypt(session_string.encode())
+        conn = get_db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO account_sessions VALUES (?, ?, ?, ?, ?)",
+                (
+                    account_id,
+                    nonce,
+                    ciphertext,
+                    self.sign(mac_key, account_id, nonce, ciphertext),
+                    time.time(),
+                ),
+            )
+
+
+session_store = SessionStore(SESSION_STORE_KEY) if SESSION_STORE_KEY else None
+
+
+async def save_session(session_id: str):
+    """Persist the session's auth key if the session store is enabled, and
+    return the resume token that unlocks it"""
+    if session_store is None:
+        return None
+    try:
+        client_info = active_clients[session_id]
+        client = client_info["client"]
+        account_id = await get_account_id(session_id, client)
+        token = client_info.get("resume_token")
+        if session_store.token_account(token) != account_id:
+            token = session_store.new_token(account_id)
+        session_store.save(token, client.session.save())
+        client_info["resume_token"] = token
+        return token
+    except Exception as e:
+        print(f"Error saving session {session_id}: {str(e)}", file=sys.stderr)
+        return None
+
+
+class EntityCache:
+    """Process-wide LRU cache of resolved group links and usernames.
+
+    Maps (account ID, normalized link) to the peer's (type, id, access_hash)
+    with a TTL, so the groups used all the time resolve without a
+    ResolveUsername round-trip. Access hashes are only valid for the account
+    that resolved them, so sessions share entries per account.
+    """
+
+    PEER_TYPES = {
+        InputPeerChannel: "channel",
+        InputPeerChat: "chat",
+        InputPeerUser: "user",
+    }
+
+    def __init__(self, max_size: int, ttl: int) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, (peer_type, peer_id, access_hash) = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        if peer_type == "channel":
+            return InputPeerChannel(peer_id, access_hash)
+        if peer_type == "chat":
+            return InputPeerChat(peer_id)
+        return InputPeerUser(peer_id, access_hash)
+
+    def put(self, key, input_peer) -> None:
+        peer_type = self.PEER_TYPES.get(type(input_peer))
+        if peer_type is None:
+            return
+        if peer_type == "chat":
+            value = (peer_type, input_peer.chat_id, None)
+        elif peer_type == "channel":
+            value = (peer_type, input_peer.channel_id, input_peer.access_hash)
+        else:
+            value = (peer_type, input_peer.user_id, input_peer.access_hash)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+entity_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+
+
+def normalize_link(link) -> str:
+    """Reduce the spellings of a group link or username to one cache key"""
+    key = str(link).strip()
+    for prefix in ("https://", "http://"):
+        if key.lower().startswith(prefix):
+            key = key[len(prefix) :]
+    for prefix in ("t.me/", "telegram.me/", "telegram.dog/"):
+        if key.lower().startswith(prefix):
+            key = key[len(prefix) :]
+    key = key.lstrip("@").rstrip("/")
+    # Invite hashes are case sensitive, usernames are not
+    if key.startswith("+") or key.lower().startswith("joinchat/"):
+        return key
+    return key.lower()
+
+
+async def resolve_input_entity(session_id: str, client, link):
+    """Resolve a group link or username through the shared entity cache"""
+    key = (await get_account_id(session_id, client), normalize_link(link))
+    input_peer = entity_cache.get(key)
+    if input_peer is None:
+        input_peer = await client.get_input_entity(link)
+        entity_cache.put(key, input_peer)
+    return input_peer
+
+
+def api_route(rule: str, methods=("GET",)):
+    """Register an async API handler for both the WSGI and the ASGI app.
+
+    The handler receives the request data (the JSON body, or the query string
+    for GET requests) and returns a ``(body, status)`` tuple, where body is a
+    dict, an EventStream or plain text. Flask runs it via its native async
+    view support; asgi.py awaits it directly. Every request naming a session
+    marks it as used for the idle reaper, and keeps it from being evicted
+    until the response, or the EventStream returned, is done.
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        async def handle(data):
+            session_id = data.get("sessionId")
+            touch_session(session_id)
+            release = hold_session(session_id)
+            body = None
+            try:
+                body, status = await handler(data)
+                return body, status
+            finally:
+                if isinstance(body, EventStream):
+                    body.release = release
+                else:
+                    release()
 
+        api_routes[rule] = (tuple(methods), handle)
 
-def async_route(f):
-    @wraps(f)
-    def wrapped(*args, **kwargs):
-        return main_loop.run_until_complete(f(*args, **kwargs))
+        @wraps(handler)
+        async def view():
+            if request.method == "GET":
+                data = request.args.to_dict()
+            else:
+                data = request.get_json(silent=True) or {}
+            body, status = await handle(data)
+            if isinstance(body, EventStream):
+                response = Response(iter(body), status=status, mimetype=body.mimetype)
+                # Also runs if the client goes away before the stream starts
+                response.call_on_close(body.close)
+                return response
+            if isinstance(body, str):
+                return Response(body, status=status, mimetype="text/plain")
+            return jsonify(body), status
+
+        app.add_url_rule(rule, handler.__name__, view, methods=list(methods))
+        return handler
 
-    return wrapped
+    return decorator
 
 
 @app.route("/api/python")
@@ -111,20 +1266,19 @@ def hello_world():
 
 
 @app.route("/api/pythonasync")
-@async_route
 async def hello_world_async():
     return "<p>Hello, World! async</p>"
 
 
-@app.route("/api/connect", methods=["POST"])
-@async_route
-async def connect():
-    data = request.json
+@api_route("/api/connect", methods=["POST"])
+async def connect(data):
     api_id = data.get("apiId")
     api_hash = data.get("apiHash")
     phone = data.get("phoneNumber")
     session_id = data.get("sessionId")
     code = data.get("code")
+    # Given out on login; only it unlocks the account's saved session
+    resume_token = data.get("resumeToken")
 
     try:
         # If we have a session_id and code, use the existing client
@@ -132,9 +1286,7 @@ async def connect():
             # We need to run this in the session's event loop
             if session_id not in session_event_loops:
                 return (
-                    jsonify(
-                        {"success": False, "message": "Session expired or invalid"}
-                    ),
+                    {"success": False, "message": "Session expired or invalid"},
                     400,
                 )
 
@@ -150,56 +1302,78 @@ async def connect():
 
             try:
                 # Wait for the result without timeout
-                sign_in_future.result()
+                await asyncio.wrap_future(sign_in_future)
 
                 # Check if authorized
                 is_authorized_future = asyncio.run_coroutine_threadsafe(
                     client.is_user_authorized(), loop
                 )
-                is_authorized = is_authorized_future.result()
+                is_authorized = await asyncio.wrap_future(is_authorized_future)
 
                 if is_authorized:
-                    return jsonify(
-                        {"success": True, "message": "Successfully authenticated"}
+                    resume_token = await asyncio.wrap_future(
+                        asyncio.run_coroutine_threadsafe(save_session(session_id), loop)
                     )
+                    return {
+                        "success": True,
+                        "message": "Successfully authenticated",
+                        "resumeToken": resume_token,
+                    }, 200
                 else:
-                    return jsonify({"success": False, "message": "Invalid code"}), 400
+                    return {"success": False, "message": "Invalid code"}, 400
             except Exception as e:
                 if "UPDATE_APP_TO_LOGIN" in str(e):
                     return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "message": "This phone number is not supported. Please try a different phone number.",
-                            }
-                        ),
+                        {
+                            "success": False,
+                            "message": "This phone number is not supported. Please try a different phone number.",
+                        },
                         400,
                     )
                 return (
-                    jsonify(
-                        {"success": False, "message": f"Authentication error: {str(e)}"}
-                    ),
+                    {"success": False, "message": f"Authentication error: {str(e)}"},
                     400,
                 )
 
-        # Initial connection - create a new session ID
-        session_id = str(random.randint(10000, 99999))
+        # Initial connection - make room under the session cap first
+        reap_sessions(reserve=1)
+        if MAX_SESSIONS and len(active_clients) >= MAX_SESSIONS:
+            return (
+                {
+                    "success": False,
+                    "message": "Too many active sessions, try again later",
+                },
+                503,
+            )
 
-        # Create a new thread and event loop for this session
-        create_session_thread(session_id)
+        # Create a new session ID
+        session_id = str(random.randint(10000, 99999))
 
-        # We need to create and start the client in the session's thread
-        # First, create a Future to store the result
-        result_future = asyncio.Future(loop=main_loop)
+        # Pin this session to one of the shared event loops
+        loop = get_session_loop(session_id)
 
         # Define the async function to run in the session's event loop
         async def _create_and_start():
             try:
+                # Reuse the saved auth key of this account when the caller
+                # proves it logged in before
+                saved_session = None
+                if session_store is not None and resume_token:
+                    saved_session = session_store.load(resume_token)
+
                 # Create the client with the session's event loop
-                client = TelegramClient(StringSession(), int(api_id), api_hash)
+                client = SessionClient(
+                    StringSession(saved_session), int(api_id), api_hash
+                )
 
                 # Store the client
-                active_clients[session_id] = {"client": client, "phone": phone}
+                active_clients[session_id] = {
+                    "client": client,
+                    "phone": phone,
+                    "last_used": time.monotonic(),
+                }
+                if saved_session is not None:
+                    active_clients[session_id]["resume_token"] = resume_token
 
                 # Define code callback
                 async def code_callback():
@@ -211,7 +1385,11 @@ async def connect():
                 await client.start(phone=phone, code_callback=code_callback)
 
                 # If we get here, user is already authorized
-                return {"success": True, "already_authorized": True}
+                return {
+                    "success": True,
+                    "already_authorized": True,
+                    "resume_token": await save_session(session_id),
+                }
             except CodeRequiredException:
                 # Code required
                 return {
@@ -224,9 +1402,6 @@ async def connect():
                 print(f"Error in _create_and_start: {str(e)}", file=sys.stderr)
                 return {"success": False, "error": str(e)}
 
-        # Get the session's event loop
-        loop = session_event_loops[session_id]
-
         # Run the coroutine in the session's event loop using run_coroutine_threadsafe
         # This follows the pattern in asyncio_loop_in_thread.py
         print("Running _create_and_start in session thread", file=sys.stderr)
@@ -236,50 +1411,43 @@ async def connect():
         try:
             # Wait for the result without timeout
             print("Waiting for future result", file=sys.stderr)
-            result = future.result()
+            result = await asyncio.wrap_future(future)
             print(f"Got result: {result}", file=sys.stderr)
 
             if not result["success"]:
                 error = result.get("error", "Unknown error")
                 if "UPDATE_APP_TO_LOGIN" in error:
                     return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "message": "This phone number is not supported. Please try a different phone number.",
-                            }
-                        ),
+                        {
+                            "success": False,
+                            "message": "This phone number is not supported. Please try a different phone number.",
+                        },
                         400,
                     )
-                return jsonify({"success": False, "message": error}), 500
+                return {"success": False, "message": error}, 500
 
             if result.get("already_authorized", False):
                 # User is already authorized
-                return jsonify(
-                    {
-                        "success": True,
-                        "message": "Already authorized",
-                        "sessionId": session_id,
-                    }
-                )
+                return {
+                    "success": True,
+                    "message": "Already authorized",
+                    "sessionId": session_id,
+                    "resumeToken": result.get("resume_token"),
+                }, 200
             else:
                 # Code required
-                return jsonify(
-                    {
-                        "success": True,
-                        "message": "A verification code has been sent to your phone. Please enter the verification code.",
-                        "sessionId": session_id,
-                    }
-                )
+                return {
+                    "success": True,
+                    "message": "A verification code has been sent to your phone. Please enter the verification code.",
+                    "sessionId": session_id,
+                }, 200
         except Exception as e:
             error_str = str(e)
             print(f"Error getting future result: {error_str}", file=sys.stderr)
             # Clean up if there was an error
             cleanup_session(session_id)
             return (
-                jsonify(
-                    {"success": False, "message": f"Connection error: {error_str}"}
-                ),
+                {"success": False, "message": f"Connection error: {error_str}"},
                 500,
             )
 
@@ -288,7 +1456,7 @@ async def connect():
         # Clean up if there was an error
         if session_id and session_id not in active_clients:
             cleanup_session(session_id)
-        return jsonify({"success": False, "message": str(e)}), 500
+        return {"success": False, "message": str(e)}, 500
 
 
 # Custom exception to handle code request
@@ -297,10 +1465,8 @@ class CodeRequiredException(Exception):
         self.session_id = session_id
 
 
-@app.route("/api/stop", methods=["POST"])
-@async_route
-async def stop_process():
-    data = request.json
+@api_route("/api/stop", methods=["POST"])
+async def stop_process(data):
     session_id = data.get("sessionId")
 
     if session_id in active_tasks and not active_tasks[session_id].done():
@@ -309,32 +1475,860 @@ async def stop_process():
             await active_tasks[session_id]
         except asyncio.CancelledError:
             pass
-        return jsonify({"success": True, "message": "Process stopped"})
+        return {"success": True, "message": "Process stopped"}, 200
 
     if session_id in background_tasks:
         try:
+            # The task removes itself and releases the session once it has
+            # unwound, which cancelling makes immediate
             background_tasks[session_id].cancel()
-            del background_tasks[session_id]
-            return jsonify({"success": True, "message": "Background process stopped"})
+            return {"success": True, "message": "Background process stopped"}, 200
         except Exception as e:
             print(f"Error stopping background task: {str(e)}", file=sys.stderr)
             return (
-                jsonify(
-                    {
-                        "success": False,
-                        "message": f"Error stopping background task: {str(e)}",
-                    }
-                ),
+                {
+                    "success": False,
+                    "message": f"Error stopping background task: {str(e)}",
+                },
                 500,
             )
 
-    return jsonify({"success": False, "message": "No active process found"}), 400
+    return {"success": False, "message": "No active process found"}, 400
 
 
-@app.route("/api/getParticipants", methods=["POST"])
-@async_route
-async def get_participants():
-    data = request.json
+async def get_users(client, input_users):
+    """Fetch users by InputUser with one GetUsersRequest"""
+    try:
+        users = await client(GetUsersRequest(id=input_users))
+    except Exception as e:
+        print(f"Error getting sender info: {str(e)}", file=sys.stderr)
+        return []
+    return [user for user in users if isinstance(user, User)]
+
+
+USER_STATUS_TYPES = {
+    cls.__name__: cls
+    for cls in (
+        UserStatusEmpty,
+        UserStatusLastMonth,
+        UserStatusLastWeek,
+        UserStatusRecently,
+    )
+}
+
+
+def status_to_row(status):
+    """Split a user status into its type name and timestamp for storage"""
+    if status is None:
+        return None, None
+    when = getattr(status, "was_online", None) or getattr(status, "expires", None)
+    return type(status).__name__, when.timestamp() if when else None
+
+
+def status_from_row(name, timestamp):
+    if name in ("UserStatusOffline", "UserStatusOnline") and timestamp is not None:
+        when = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        if name == "UserStatusOffline":
+            return UserStatusOffline(was_online=when)
+        return UserStatusOnline(expires=when)
+    status_type = USER_STATUS_TYPES.get(name)
+    return status_type() if status_type else None
+
+
+class ParticipantRecord:
+    """The fields of a scanned user needed to list and invite them.
+
+    Built from each eligible Telethon User as it is scanned, so the User,
+    with its photo, restriction reasons and the rest, can be dropped right
+    away. The last-seen text is shared between records. seen_at ranks how
+    recently the user was active, as a POSIX timestamp, so the freshest of
+    several sightings of the same user can be kept.
+    """
+
+    __slots__ = (
+        "id",
+        "access_hash",
+        "first_name",
+        "last_name",
+        "username",
+        "phone",
+        "last_seen",
+        "seen_at",
+    )
+
+    def __init__(
+        self,
+        id,
+        access_hash,
+        first_name,
+        last_name,
+        username,
+        phone,
+        last_seen,
+        seen_at=0,
+    ) -> None:
+        self.id = id
+        self.access_hash = access_hash
+        self.first_name = first_name
+        self.last_name = last_name
+        self.username = username
+        self.phone = phone
+        self.last_seen = last_seen
+        self.seen_at = seen_at
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "firstName": self.first_name,
+            "lastName": self.last_name,
+            "username": self.username,
+            "phone": self.phone,
+            "status": "pending",
+            "lastSeen": self.last_seen,
+        }
+
+
+class EligibilityFilter:
+    """Decides which scanned users to offer for inviting, once per scan.
+
+    The time and the activity cutoff are fixed when the scan starts and
+    statuses are told apart by their exact type, so a user is accepted or
+    dropped with two ID lookups and at most one datetime comparison, before
+    any record is built for it.
+    """
+
+    # Users last seen 7 whole days ago or less count as recently active,
+    # i.e. anyone seen less than 8 days ago
+    ACTIVE_DAYS = 8
+
+    # How long ago a hidden status places the user at most, in days
+    STATUS_AGE_DAYS = {
+        UserStatusRecently: 3,
+        UserStatusLastWeek: 7,
+        UserStatusLastMonth: 30,
+    }
+
+    def __init__(self, member_ids, invited_ids, only_recently_active) -> None:
+        self.member_ids = member_ids
+        self.invited_ids = invited_ids
+        self.only_recently_active = only_recently_active
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+        self.cutoff = self.now - datetime.timedelta(days=self.ACTIVE_DAYS)
+        self.texts = {}
+
+    def __call__(self, user) -> bool:
+        # Only an offline status carries a time; online, hidden and unknown
+        # statuses all count as active
+        status = user.status
+        if (
+            self.only_recently_active
+            and type(status) is UserStatusOffline
+            and status.was_online <= self.cutoff
+        ):
+            return False
+        return user.id not in self.member_ids and user.id not in self.invited_ids
+
+    def last_seen(self, status) -> str:
+        status_type = type(status)
+        if status_type is UserStatusOffline:
+            text = f"Last seen {(self.now - status.was_online).days} days ago"
+        elif status_type is UserStatusOnline:
+            return "Online recently"
+        else:
+            text = str(status)
+        # Only a few distinct texts exist per scan; keep one copy of each
+        return self.texts.setdefault(text, text)
+
+    def seen_at(self, status) -> int:
+        """When the user was last active, at the latest, or 0 if unknown"""
+        status_type = type(status)
+        if status_type is UserStatusOffline:
+            return int(status.was_online.timestamp())
+        if status_type is UserStatusOnline:
+            return int(self.now.timestamp())
+        days = self.STATUS_AGE_DAYS.get(status_type)
+        if days is None:
+            return 0
+        return int(self.now.timestamp()) - days * 86400
+
+    def to_record(self, user) -> ParticipantRecord:
+        return ParticipantRecord(
+            user.id,
+            user.access_hash,
+            user.first_name,
+            user.last_name,
+            user.username,
+            user.phone,
+            self.last_seen(user.status),
+            self.seen_at(user.status),
+        )
+
+
+def group_overlap(group_masks, group_count: int) -> list:
+    """Per group, its eligible users, those found in no other group, and
+    how many it shares with each other group.
+
+    group_masks holds, for each user, a bitmask of the groups it was found
+    in, by position in the list of source groups.
+    """
+    eligible = [0] * group_count
+    unique = [0] * group_count
+    shared = [[0] * group_count for _ in range(group_count)]
+    for mask in group_masks:
+        if mask & (mask - 1) == 0:
+            index = mask.bit_length() - 1
+            eligible[index] += 1
+            unique[index] += 1
+            continue
+        indexes = [i for i in range(group_count) if mask >> i & 1]
+        for i in indexes:
+            eligible[i] += 1
+            for j in indexes:
+                if i != j:
+                    shared[i][j] += 1
+    return [
+        {"eligible": eligible[i], "unique": unique[i], "shared": shared[i]}
+        for i in range(group_count)
+    ]
+
+
+class ScanCheckpoint:
+    """What earlier history scans of one source group already covered.
+
+    Keeps, per account, the range of message IDs scanned, how many messages
+    it held and the senders seen with the newest message of each. A repeat
+    scan walks messages newer than the range, then older ones while the
+    range holds fewer than the messages asked for. min_message_id is 0 once
+    the start of history is reached. A checkpoint is dropped SCAN_CACHE_TTL
+    after it was started, or once it holds more than SCAN_CACHE_MAX_SENDERS.
+    """
+
+    FLUSH_SIZE = 100
+
+    def __init__(self, account_id: int, group_id: int) -> None:
+        self.account_id = account_id
+        self.group_id = group_id
+        conn = get_db()
+        row = conn.execute(
+            "SELECT max_message_id, min_message_id, message_count, created_at"
+            " FROM history_checkpoints WHERE account_id = ? AND group_id = ?",
+            (account_id, group_id),
+        ).fetchone()
+        if row is not None and (
+            row[3] < time.time() - SCAN_CACHE_TTL
+            or conn.execute(
+                "SELECT COUNT(*) FROM history_senders"
+                " WHERE account_id = ? AND group_id = ?",
+                (account_id, group_id),
+            ).fetchone()[0]
+            > SCAN_CACHE_MAX_SENDERS
+        ):
+            self.clear()
+            row = None
+        if row is None:
+            row = (0, None, 0, time.time())
+        (
+            self.max_message_id,
+            self.min_message_id,
+            self.message_count,
+            self.created_at,
+        ) = row
+        self.pending = []
+        self.walked = 0
+        self.walk_oldest = None
+
+    def clear(self) -> None:
+        conn = get_db()
+        with conn:
+            for table in ("history_checkpoints", "history_senders"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE account_id = ? AND group_id = ?",
+                    (self.account_id, self.group_id),
+                )
+
+    def begin_walk(self) -> None:
+        self.walked = 0
+        self.walk_oldest = None
+
+    def add_message(self, message_id: int) -> None:
+        self.walked += 1
+        if message_id > self.max_message_id:
+            self.max_message_id = message_id
+        if self.walk_oldest is None or message_id < self.walk_oldest:
+            self.walk_oldest = message_id
+
+    def end_newer_walk(self, limit: int) -> None:
+        """Account for a walk of up to limit messages newer than the range"""
+        if self.message_count and self.walked >= limit:
+            # Newer history alone filled the walk, so the messages between it
+            # and the cached range were never seen; start the range over
+            self.flush()
+            conn = get_db()
+            with conn:
+                conn.execute(
+                    "DELETE FROM history_senders WHERE account_id = ?"
+                    " AND group_id = ? AND message_id < ?",
+                    (self.account_id, self.group_id, self.walk_oldest),
+                )
+            self.min_message_id = self.walk_oldest
+            self.message_count = self.walked
+            return
+        if self.min_message_id is None:
+            # A first walk that came back short reached the start of history
+            self.min_message_id = self.walk_oldest if self.walked >= limit else 0
+        self.message_count += self.walked
+
+    def end_older_walk(self, limit: int) -> None:
+        """Account for a walk of up to limit messages older than the range"""
+        if self.walked < limit:
+            self.min_message_id = 0
+        elif self.walk_oldest is not None:
+            self.min_message_id = self.walk_oldest
+        self.message_count += self.walked
+
+    def add_sender(self, user, message_id: int) -> None:
+        self.pending.append((user, message_id))
+        if len(self.pending) >= self.FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        conn = get_db()
+        with conn:
+            # A sender found again keeps the newest message it was seen at
+            conn.executemany(
+                "INSERT INTO history_senders VALUES"
+                " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (account_id, group_id, user_id) DO UPDATE SET"
+                " access_hash = excluded.access_hash,"
+                " first_name = excluded.first_name,"
+                " last_name = excluded.last_name,"
+                " username = excluded.username,"
+                " phone = excluded.phone,"
+                " status = excluded.status,"
+                " status_time = excluded.status_time,"
+                " message_id = max(message_id, excluded.message_id)",
+                [
+                    (
+                        self.account_id,
+                        self.group_id,
+                        user.id,
+                        user.access_hash,
+                        user.first_name,
+                        user.last_name,
+                        user.username,
+                        user.phone,
+                        *status_to_row(user.status),
+                        message_id,
+                    )
+                    for user, message_id in self.pending
+                ],
+            )
+        self.pending = []
+
+    def save(self) -> None:
+        """Record the range of history scanned so far"""
+        self.flush()
+        conn = get_db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO history_checkpoints"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.account_id,
+                    self.group_id,
+                    self.max_message_id,
+                    self.min_message_id or 0,
+                    self.message_count,
+                    self.created_at,
+                    time.time(),
+                ),
+            )
+
+    def cached_senders(self, exclude, oldest_id=0):
+        """Yield, a batch at a time, the senders from earlier scans whose IDs
+        are not in exclude and who sent a message from oldest_id on"""
+        rows = get_db().execute(
+            "SELECT user_id, access_hash, first_name, last_name, username, phone,"
+            " status, status_time FROM history_senders"
+            " WHERE account_id = ? AND group_id = ? AND message_id >= ?",
+            (self.account_id, self.group_id, oldest_id),
+        )
+        while True:
+            batch = rows.fetchmany(self.FLUSH_SIZE)
+            if not batch:
+                return
+            yield [
+                User(
+                    id=user_id,
+                    access_hash=access_hash,
+                    first_name=first_name,
+                    last_name=last_name,
+                    username=username,
+                    phone=phone,
+                    status=status_from_row(status, status_time),
+                )
+                for (
+                    user_id,
+                    access_hash,
+                    first_name,
+                    last_name,
+                    username,
+                    phone,
+                    status,
+                    status_time,
+                ) in batch
+                if user_id not in exclude
+            ]
+
+
+class CompactIdSet:
+    """A set of user IDs stored as a sorted int64 array.
+
+    Uses 8 bytes per ID instead of the ~60 a Python set of ints needs, with
+    O(log n) lookups.
+    """
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=()) -> None:
+        self.ids = array("q", sorted(set(ids)))
+
+    def __contains__(self, user_id) -> bool:
+        i = bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, user_id: int) -> None:
+        i = bisect_left(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            self.ids.insert(i, user_id)
+
+
+class MembershipIndex:
+    """The member IDs of one target group.
+
+    Loaded in full once, then topped up with the most recent members every
+    MEMBERSHIP_REFRESH_TTL seconds and only reloaded in full after
+    MEMBERSHIP_RELOAD_TTL. Completed invites are added in place.
+    """
+
+    def __init__(self, peer_id: int) -> None:
+        self.peer_id = peer_id
+        self.members = CompactIdSet()
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    async def refresh(self, client, target_entity) -> None:
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at > MEMBERSHIP_RELOAD_TTL:
+            ids = array("q")
+            async for participant in client.iter_participants(target_entity):
+                ids.append(participant.id)
+            self.members = CompactIdSet(ids)
+            self.loaded_at = self.refreshed_at = now
+            print(
+                f"Loaded {len(self.members)} members of {self.peer_id}",
+                file=sys.stderr,
+            )
+        elif now - self.refreshed_at > MEMBERSHIP_REFRESH_TTL:
+            recent = await client.get_participants(
+                target_entity, limit=MEMBERSHIP_REFRESH_LIMIT
+            )
+            for participant in recent:
+                self.members.add(participant.id)
+            self.refreshed_at = now
+
+
+async def get_membership_index(client, target_entity) -> MembershipIndex:
+    """Return the up-to-date member index of a target group"""
+    peer_id = utils.get_peer_id(target_entity)
+    with membership_lock:
+        membership = membership_indexes.get(peer_id)
+        if membership is None:
+            membership = membership_indexes[peer_id] = MembershipIndex(peer_id)
+    await membership.refresh(client, target_entity)
+    return membership
+
+
+def is_known_member(target_entity, user_id: int) -> bool:
+    """Check a loaded member index without fetching anything"""
+    membership = membership_indexes.get(utils.get_peer_id(target_entity))
+    return membership is not None and user_id in membership.members
+
+
+def record_member(target_entity, user_id: int) -> None:
+    """Add a user we just invited to the target's member index"""
+    membership = membership_indexes.get(utils.get_peer_id(target_entity))
+    if membership is not None:
+        membership.members.add(user_id)
+
+
+def invited_user_ids(updates):
+    """The IDs of the users an invite's updates show were added, or None if
+    they carry no service message to tell.
+
+    Megagroups announce new members with a service message, but broadcast
+    channels do not, and UpdateChannelParticipant only reaches bots.
+    """
+    if hasattr(updates, "update"):
+        # UpdateShort wraps a single update
+        updates = [updates.update]
+    else:
+        updates = getattr(updates, "updates", None) or []
+    added = None
+    for update in updates:
+        action = getattr(getattr(update, "message", None), "action", None)
+        if isinstance(action, MessageActionChatAddUser):
+            added = (added or set()) | set(action.users)
+        elif isinstance(update, UpdateChannelParticipant) and update.new_participant:
+            added = (added or set()) | {update.user_id}
+    return added
+
+
+# Errors that will fail the same way however often an invite is retried.
+# ValueError is what Telethon raises when it cannot resolve a user at all.
+PERMANENT_INVITE_ERRORS = (
+    BotGroupsBlockedError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    ChatWriteForbiddenError,
+    InputUserDeactivatedError,
+    PeerIdInvalidError,
+    UserAlreadyParticipantError,
+    UserBannedInChannelError,
+    UserBotError,
+    UserChannelsTooMuchError,
+    UserIdInvalidError,
+    UserKickedError,
+    UserNotMutualContactError,
+    UserPrivacyRestrictedError,
+    UsersTooMuchError,
+    ValueError,
+)
+
+
+# Errors telling the account to slow down
+RATE_LIMIT_ERRORS = (FloodError, PeerFloodError)
+
+
+def classify_error(error: Exception) -> str:
+    """Return "permanent", "rate_limit" or "transient" for a failed request"""
+    if isinstance(error, PERMANENT_INVITE_ERRORS):
+        return "permanent"
+    if isinstance(error, RATE_LIMIT_ERRORS):
+        return "rate_limit"
+    return "transient"
+
+
+def record_invite(
+    target_entity, user_id: int, status: str, reason=None, error_kind=None
+) -> None:
+    """Write the outcome of an invite attempt to the invited-user ledger.
+
+    A failure is stored with the classify_error kind of its error. Only
+    permanent ones are final, so the others are not written at all and
+    leave whatever outcome the user already has.
+    """
+    if status == "failed" and error_kind != "permanent":
+        return
+    try:
+        conn = get_db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO invite_ledger VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    utils.get_peer_id(target_entity),
+                    user_id,
+                    status,
+                    reason,
+                    error_kind,
+                    time.time(),
+                ),
+            )
+    except Exception as e:
+        print(f"Error recording invite of {user_id}: {str(e)}", file=sys.stderr)
+
+
+def import_invited_ids(target_entity, user_ids) -> None:
+    """Add invite history kept by older clients to the ledger, leaving the
+    outcomes it already has for those users as they are"""
+    now = time.time()
+    target_id = utils.get_peer_id(target_entity)
+    try:
+        conn = get_db()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO invite_ledger VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        target_id,
+                        user_id,
+                        "invited",
+                        "Imported from the browser",
+                        None,
+                        now,
+                    )
+                    for user_id in user_ids
+                ),
+            )
+    except Exception as e:
+        print(f"Error importing invite history: {str(e)}", file=sys.stderr)
+
+
+def load_invited_ids(target_entity) -> CompactIdSet:
+    """Return the IDs of the users the ledger has a final outcome for: invited,
+    skipped or failed permanently"""
+    rows = get_db().execute(
+        "SELECT user_id FROM invite_ledger WHERE target_id = ?"
+        " AND (status IN ('invited', 'skipped') OR error_kind = 'permanent')",
+        (utils.get_peer_id(target_entity),),
+    )
+    return CompactIdSet(user_id for (user_id,) in rows)
+
+
+async def import_phone_contacts(client, contacts) -> dict:
+    """Resolve phone numbers to users with batched ImportContactsRequests.
+
+    contacts is a list of (phone, first_name, last_name). Up to
+    IMPORT_CONTACTS_BATCH_SIZE of them are packed into each request, each with
+    its own client_id, and the imported users are mapped back to their phone
+    through that ID. Batches are spaced out by the client's pacer.
+
+    Numbers Telegram answers with retry_contacts, and batches that fail with
+    a transient error, are queued again after RETRY_DELAY, up to
+    IMPORT_CONTACTS_RETRIES times. A rate limit stops the import. Returns a
+    dict of phone to User for the numbers that have an account, and to the
+    error for the ones that could not be looked up; numbers without an
+    account are left out.
+    """
+    users_by_phone = {}
+    pending = deque(range(len(contacts)))
+    attempts = [0] * len(contacts)
+
+    def retry_later(client_ids, error) -> None:
+        requeued = False
+        for client_id in client_ids:
+            attempts[client_id] += 1
+            if attempts[client_id] > IMPORT_CONTACTS_RETRIES:
+                users_by_phone[contacts[client_id][0]] = error
+            else:
+                pending.append(client_id)
+                requeued = True
+        if requeued:
+            # Hold back every import of this session, not just the retries
+            client.pacer.block(ImportContactsRequest.__name__, RETRY_DELAY)
+
+    while pending:
+        client_ids = [
+            pending.popleft()
+            for _ in range(min(IMPORT_CONTACTS_BATCH_SIZE, len(pending)))
+        ]
+        batch = [
+            InputPhoneContact(
+                client_id=client_id,
+                phone=contacts[client_id][0],
+                first_name=contacts[client_id][1],
+                last_name=contacts[client_id][2],
+            )
+            for client_id in client_ids
+        ]
+        try:
+            result = await client(ImportContactsRequest(batch))
+        except Exception as e:
+            print(
+                f"Error importing {len(batch)} contacts: {str(e)}",
+                file=sys.stderr,
+            )
+            kind = classify_error(e)
+            if kind == "transient":
+                retry_later(client_ids, e)
+                continue
+            if kind == "rate_limit":
+                # Every later batch would hit the same limit
+                client_ids.extend(pending)
+                pending.clear()
+            for client_id in client_ids:
+                users_by_phone[contacts[client_id][0]] = e
+            continue
+
+        users = {user.id: user for user in result.users}
+        for imported in result.imported:
+            user = users.get(imported.user_id)
+            if user is not None:
+                users_by_phone[contacts[imported.client_id][0]] = user
+
+        requested = set(client_ids)
+        retry = [
+            client_id for client_id in result.retry_contacts if client_id in requested
+        ]
+        if retry:
+            print(
+                f"Telegram asked to retry {len(retry)} contacts later",
+                file=sys.stderr,
+            )
+            retry_later(
+                retry, FloodError(ImportContactsRequest(batch), "RETRY_CONTACTS")
+            )
+
+    return users_by_phone
+
+
+async def take_items(iterator, count: int) -> list:
+    """Read up to count items from an async iterator that is used again later"""
+    items = []
+    while len(items) < count:
+        try:
+            items.append(await iterator.__anext__())
+        except StopAsyncIteration:
+            break
+    return items
+
+
+async def chain_items(items, iterator):
+    """Yield items, then the rest of an async iterator without restarting it"""
+    for item in items:
+        yield item
+    while True:
+        try:
+            yield await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+
+
+async def run_workers(items, worker, concurrency: int, gate=None, stop_on=()) -> None:
+    """Run worker on every item with up to concurrency calls in flight.
+
+    Each worker takes the next item from a shared queue as soon as it is
+    done with its last one, so one slow item only holds up its own slot.
+    While the optional gate event is cleared, workers wait before taking
+    their next item. An exception of a type in stop_on stops every worker
+    from taking another item and is raised once the ones in flight are done.
+    """
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    stopped = []
+
+    async def _worker():
+        while not stopped:
+            if gate is not None:
+                await gate.wait()
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await worker(item)
+            except stop_on as e:
+                stopped.append(e)
+            except Exception as e:
+                print(f"Worker failed on an item: {str(e)}", file=sys.stderr)
+
+    await asyncio.gather(*(_worker() for _ in range(min(concurrency, queue.qsize()))))
+    if stopped:
+        raise stopped[0]
+
+
+async def iter_history_senders(client, group_entity, max_messages, checkpoint=None):
+    """Yield the distinct users who sent the last max_messages messages of a group.
+
+    History is walked page by page with iter_messages and each sender is taken
+    from the users vector returned with its page, so memory depends on the page
+    size rather than on max_messages. Senders missing from the page are fetched
+    with one GetUsersRequest per batch of IDs.
+
+    With a checkpoint, only history outside what earlier scans covered is
+    walked: messages newer than the last scan, then older ones while fewer
+    than max_messages are covered. The senders cached by earlier scans are
+    yielded after the new ones.
+    """
+    seen_senders = set()
+
+    async def walk(limit, **kwargs):
+        # The message each missing sender was found at, by user ID
+        missing = {}
+
+        async def resolve_missing():
+            users = await get_users(
+                client, [input_user for input_user, _ in missing.values()]
+            )
+            found = [(user, missing[user.id][1]) for user in users]
+            missing.clear()
+            return found
+
+        async for message in client.iter_messages(group_entity, limit=limit, **kwargs):
+            if checkpoint:
+                checkpoint.add_message(message.id)
+
+            sender_id = message.sender_id
+            if not sender_id or sender_id in seen_senders:
+                continue
+            seen_senders.add(sender_id)
+
+            sender = message.sender
+            if isinstance(sender, User):
+                if checkpoint:
+                    checkpoint.add_sender(sender, message.id)
+                yield sender
+            elif sender is None and sender_id > 0 and message.input_sender is not None:
+                # Channels post with negative IDs and are never invited
+                missing[sender_id] = (
+                    utils.get_input_user(message.input_sender),
+                    message.id,
+                )
+                if len(missing) >= GET_USERS_BATCH_SIZE:
+                    for user, message_id in await resolve_missing():
+                        if checkpoint:
+                            checkpoint.add_sender(user, message_id)
+                        yield user
+
+        if missing:
+            for user, message_id in await resolve_missing():
+                if checkpoint:
+                    checkpoint.add_sender(user, message_id)
+                yield user
+
+    if checkpoint is None:
+        async for user in walk(max_messages):
+            yield user
+        return
+
+    checkpoint.begin_walk()
+    async for user in walk(max_messages, min_id=checkpoint.max_message_id):
+        yield user
+    checkpoint.end_newer_walk(max_messages)
+
+    # Extend the range into older history when more messages are asked for
+    remaining = max_messages - checkpoint.message_count
+    if remaining > 0 and checkpoint.min_message_id:
+        checkpoint.begin_walk()
+        async for user in walk(remaining, offset_id=checkpoint.min_message_id):
+            yield user
+        checkpoint.end_older_walk(remaining)
+
+    checkpoint.save()
+    oldest_id = 0
+    if checkpoint.message_count > max_messages:
+        # The range holds more history than asked for; only reuse the senders
+        # of the newest max_messages messages
+        window = await client.get_messages(
+            group_entity, limit=1, add_offset=max_messages - 1
+        )
+        if window:
+            oldest_id = window[0].id
+    for cached in checkpoint.cached_senders(seen_senders, oldest_id):
+        # Let Telethon resolve the cached users by ID when inviting them
+        client.session.process_entities(cached)
+        for user in cached:
+            yield user
+
+
+@api_route("/api/getParticipants", methods=["POST"])
+async def get_participants(data):
     source_groups = data.get("sourceGroups")
     target_group = data.get("targetGroup")
     session_id = data.get("sessionId")
@@ -343,53 +2337,175 @@ async def get_participants():
     delay_range = data.get("delayRange", {"min": 60, "max": 60})
     max_messages = max(1, data.get("maxMessages", 3000))
     only_recently_active = data.get("onlyRecentlyActive", True)
+    # Reuse earlier history scans of the same groups and only walk newer messages
+    use_scan_cache = data.get("useScanCache", True)
+    # "ndjson" or "sse" streams results as they are found
+    stream_format = data.get("stream")
 
     try:
         if session_id not in active_clients:
             return (
-                jsonify({"success": False, "message": "No active session found"}),
+                {"success": False, "message": "No active session found"},
+                400,
+            )
+        if stream_format and stream_format not in EventStream.MIMETYPES:
+            return (
+                {"success": False, "message": f"Unknown stream format {stream_format}"},
                 400,
             )
 
         client = active_clients[session_id]["client"]
 
-        # Make sure we have an event loop for this session
-        if session_id not in session_event_loops:
-            create_session_thread(session_id)
-
         # Get the session's event loop
-        loop = session_event_loops[session_id]
+        loop = get_session_loop(session_id)
 
-        # Define the async function to run in the session's event loop
-        async def _get_participants():
+        # Define the async function to run in the session's event loop.
+        # With emit set, participants and progress are pushed as events
+        # instead of being collected into one response.
+        async def _get_participants(emit=None):
             try:
-                eligible_participants = []
+                # A user found in several source groups is listed once, with
+                # the record showing the most recent activity, while
+                # group_masks tracks every group it was found in. seen_at
+                # holds when each user was last active; the records are only
+                # kept for a single response, a stream sends them and lets go
+                group_links = list(dict.fromkeys(source_groups))
+                seen_at = {}
+                eligible_participants = {}
+                group_masks = {}
+                scanned_counts = [0] * len(group_links)
+
+                async def add_eligible(group_index, record):
+                    user_id = record.id
+                    group_masks[user_id] = group_masks.get(user_id, 0) | (
+                        1 << group_index
+                    )
+                    known = seen_at.get(user_id)
+                    if known is not None and known >= record.seen_at:
+                        return
+                    seen_at[user_id] = record.seen_at
+                    if emit is None:
+                        eligible_participants[user_id] = record
+                        return
+                    # A fresher record for a user already sent replaces it
+                    event_type = "participant" if known is None else "update"
+                    await emit(
+                        {
+                            "type": event_type,
+                            "group": group_links[group_index],
+                            "participant": record.to_dict(),
+                        }
+                    )
+
+                def group_stats():
+                    stats = group_overlap(group_masks.values(), len(group_links))
+                    return [
+                        {
+                            "group": group_link,
+                            "scanned": scanned_counts[i],
+                            "eligible": stats[i]["eligible"],
+                            "unique": stats[i]["unique"],
+                            "overlap": {
+                                other: count
+                                for other, count in zip(group_links, stats[i]["shared"])
+                                if count
+                            },
+                        }
+                        for i, group_link in enumerate(group_links)
+                    ]
+
+                async def report(group_link, **progress):
+                    if emit is not None:
+                        await emit(
+                            {"type": "progress", "group": group_link, **progress}
+                        )
 
                 # Get target group info
-                target_entity = await client.get_input_entity(target_group)
+                target_entity = await resolve_input_entity(
+                    session_id, client, target_group
+                )
                 is_channel = isinstance(target_entity, InputPeerChannel)
-                target_participants = await client.get_participants(target_group)
-                target_member_ids = {p.id for p in target_participants}
+                target_member_ids = (
+                    await get_membership_index(client, target_entity)
+                ).members
 
                 # Store target entity in active_clients
                 active_clients[session_id]["target_entity"] = target_entity
                 active_clients[session_id]["is_channel"] = is_channel
                 active_clients[session_id]["delay_range"] = delay_range
 
-                previously_invited_to_target = {
-                    invite["id"]
-                    for invite in previously_invited
-                    if invite["groupId"] == target_group
-                }
+                # Users already attempted, from the ledger; invite history
+                # posted by older clients is moved into it first
+                import_invited_ids(
+                    target_entity,
+                    {
+                        invite["id"]
+                        for invite in previously_invited
+                        if invite.get("groupId") == target_group
+                        and isinstance(invite.get("id"), int)
+                    },
+                )
+                previously_invited_to_target = load_invited_ids(target_entity)
+                is_eligible = EligibilityFilter(
+                    target_member_ids,
+                    previously_invited_to_target,
+                    only_recently_active,
+                )
 
                 # Create a task for each source group
-                async def process_group(group_link):
+                async def filter_group(group_index, participants, limit):
+                    """Check participants as they arrive and emit the eligible ones"""
+                    group_link = group_links[group_index]
+                    scanned = 0
+                    eligible_count = 0
+                    async for participant in participants:
+                        scanned += 1
+                        # Check eligibility criteria
+                        if is_eligible(participant):
+                            await add_eligible(
+                                group_index, is_eligible.to_record(participant)
+                            )
+                            eligible_count += 1
+                        if scanned % PROGRESS_INTERVAL == 0:
+                            await report(
+                                group_link,
+                                stage="scanning",
+                                scanned=scanned,
+                                eligible=eligible_count,
+                            )
+                        if limit > 0 and scanned >= limit:
+                            break
+
+                    scanned_counts[group_index] = scanned
+                    await report(
+                        group_link,
+                        stage="done",
+                        scanned=scanned,
+                        eligible=eligible_count,
+                    )
+                    return eligible_count
+
+                async def history_senders(group_entity):
+                    checkpoint = None
+                    if use_scan_cache:
+                        checkpoint = ScanCheckpoint(
+                            await get_account_id(session_id, client),
+                            utils.get_peer_id(group_entity),
+                        )
+                    return iter_history_senders(
+                        client, group_entity, max_messages, checkpoint
+                    )
+
+                async def process_group(group_index):
+                    group_link = group_links[group_index]
                     try:
                         print("process group", file=sys.stderr)
-                        group_eligible_participants = []
+                        await report(group_link, stage="started")
 
                         # Get group info first
-                        group_entity = await client.get_input_entity(group_link)
+                        group_entity = await resolve_input_entity(
+                            session_id, client, group_link
+                        )
                         print("get_input_entity", file=sys.stderr)
 
                         try:
@@ -402,70 +2518,27 @@ async def get_participants():
                                 full_channel.full_chat.participants_count
                             )
 
-                            # Try to get participants directly first
-                            print("get_participants", file=sys.stderr)
-
-                            participants = await client.get_participants(
-                                group_link, limit=max_per_group
-                            )
-                            print(len(participants), file=sys.stderr)
+                            # Try to get participants directly first, page
+                            # by page, looking at the first ones to see
+                            # whether the member list is visible at all
+                            print("iter_participants", file=sys.stderr)
+
+                            # maxPerGroup 0 means no limit, not no participants
+                            participants = client.iter_participants(
+                                group_entity, limit=max_per_group or None
+                            ).__aiter__()
+                            head = await take_items(participants, 99)
+                            print(len(head), file=sys.stderr)
                             # If we can't get all participants, use message history
-                            if (
-                                len(participants) < total_participants
-                                and len(participants) < 99
-                            ):
-                                participants = []
-                                seen_senders = set()
-                                message_participants = []
-
-                                # Get messages and process them with the max_messages limit
-                                messages = await client.get_messages(
-                                    group_entity, limit=max_messages
-                                )
-
-                                # Create tasks for getting sender entities
-                                sender_tasks = []
-                                for message in messages:
-                                    if (
-                                        message.sender_id
-                                        and message.sender_id not in seen_senders
-                                    ):
-                                        seen_senders.add(message.sender_id)
-                                        sender_tasks.append(
-                                            asyncio.create_task(
-                                                _get_sender_entity(message.sender_id)
-                                            )
-                                        )
-
-                                # Gather all sender entities
-                                sender_results = await asyncio.gather(
-                                    *sender_tasks, return_exceptions=True
-                                )
-                                for result in sender_results:
-                                    if (
-                                        not isinstance(result, Exception)
-                                        and result is not None
-                                    ):
-                                        message_participants.append(result)
-
-                                # Combine participants from both methods
-                                participants.extend(message_participants)
-
-                            if max_per_group > 0 and len(participants) > max_per_group:
-                                participants = participants[:max_per_group]
-
-                            for participant in participants:
-                                # Check eligibility criteria
-                                if process_participant(
-                                    participant,
-                                    target_member_ids,
-                                    previously_invited_to_target,
-                                    only_recently_active,
-                                ):
-                                    group_eligible_participants.append(
-                                        participant_to_dict(participant)
-                                    )
-                            return group_eligible_participants
+                            if len(head) < total_participants and len(head) < 99:
+                                # Walk message senders with the max_messages limit
+                                senders = await history_senders(group_entity)
+                            else:
+                                senders = chain_items(head, participants)
+
+                            return await filter_group(
+                                group_index, senders, max_per_group
+                            )
 
                         except ChatAdminRequiredError:
                             print(
@@ -473,187 +2546,78 @@ async def get_participants():
                                 file=sys.stderr,
                             )
                             # Continue with message history approach
-                            seen_senders = set()
-                            participants = []
-
-                            messages = await client.get_messages(
-                                group_entity, limit=max_messages
-                            )
-
-                            # Create tasks for getting sender entities
-                            sender_tasks = []
-                            for message in messages:
-                                if (
-                                    message.sender_id
-                                    and message.sender_id not in seen_senders
-                                ):
-                                    seen_senders.add(message.sender_id)
-                                    sender_tasks.append(
-                                        asyncio.create_task(
-                                            _get_sender_entity(message.sender_id)
-                                        )
-                                    )
-
-                            # Gather all sender entities
-                            sender_results = await asyncio.gather(
-                                *sender_tasks, return_exceptions=True
-                            )
-                            for result in sender_results:
-                                if (
-                                    not isinstance(result, Exception)
-                                    and result is not None
-                                ):
-                                    participants.append(result)
-
-                            # Process participants
-                            for participant in participants:
-                                # Check eligibility criteria
-                                if process_participant(
-                                    participant,
-                                    target_member_ids,
-                                    previously_invited_to_target,
-                                    only_recently_active,
-                                ):
-                                    group_eligible_participants.append(
-                                        participant_to_dict(participant)
-                                    )
-
-                            return group_eligible_participants
+                            senders = await history_senders(group_entity)
+                            return await filter_group(group_index, senders, 0)
 
                     except Exception as e:
                         print(
                             f"Error getting participants from {group_link}: {str(e)}",
                             file=sys.stderr,
                         )
-                        return []
-
-                # Helper function to get a sender entity
-                async def _get_sender_entity(sender_id):
-                    try:
-                        return await client.get_entity(sender_id)
-                    except Exception as e:
-                        print(f"Error getting sender info: {str(e)}", file=sys.stderr)
-                        return None
+                        await report(group_link, stage="failed", error=str(e))
+                        return 0
 
                 # Create tasks for each source group
                 group_tasks = [
-                    asyncio.create_task(process_group(group_link))
-                    for group_link in source_groups
+                    asyncio.create_task(process_group(group_index))
+                    for group_index in range(len(group_links))
                 ]
                 # Gather results from all groups
-                group_results = await asyncio.gather(
-                    *group_tasks, return_exceptions=True
-                )
+                await asyncio.gather(*group_tasks, return_exceptions=True)
 
-                # Combine eligible participants from all groups
-                for result in group_results:
-                    if not isinstance(result, Exception) and result:
-                        eligible_participants.extend(result)
-
-                # Store eligible participants for background invite
-                active_clients[session_id][
-                    "eligible_participants"
-                ] = eligible_participants
+                message = f"Found {len(seen_at)} eligible participants"
+                if emit is not None:
+                    return {
+                        "success": True,
+                        "message": message,
+                        "groups": group_stats(),
+                    }
 
                 return {
                     "success": True,
-                    "message": f"Found {len(eligible_participants)} eligible participants",
-                    "participants": eligible_participants,
+                    "message": message,
+                    "participants": [
+                        record.to_dict() for record in eligible_participants.values()
+                    ],
+                    "groups": group_stats(),
                 }
             except Exception as e:
                 print(f"Error in _get_participants: {str(e)}", file=sys.stderr)
                 return {"success": False, "message": str(e)}
 
-        # Helper functions for participant processing
-        def process_participant(
-            participant,
-            target_member_ids,
-            previously_invited_to_target,
-            only_recently_active,
-        ):
-            # Check if user was recently active
-            is_recently_active = True
-            if only_recently_active:
-                try:
-                    # Get user's status
-                    user_status = participant.status
-                    # Check if user was online recently (within last 7 days)
-                    import datetime
-
-                    now = datetime.datetime.now(datetime.timezone.utc)
-                    if hasattr(user_status, "was_online"):
-                        # Calculate days since last online
-                        days_since_online = (now - user_status.was_online).days
-                        is_recently_active = days_since_online <= 7
-                    elif hasattr(user_status, "expires"):
-                        # User is online or was recently
-                        is_recently_active = True
-                    else:
-                        # Unknown status, default to include
-                        is_recently_active = True
-                except Exception as e:
-                    print(f"Error checking user status: {str(e)}", file=sys.stderr)
-                    return False
+        if stream_format:
 
-            return (
-                participant.id not in target_member_ids
-                and participant.id not in previously_invited_to_target
-                and (not only_recently_active or is_recently_active)
-            )
+            async def _stream_participants(emit):
+                result = await _get_participants(emit)
+                await emit({"type": "done", **result})
 
-        def participant_to_dict(participant):
-            # Add status info to the participant data
-            status_text = "Unknown"
-            try:
-                import datetime
-
-                if hasattr(participant.status, "was_online"):
-                    status_text = f"Last seen {(datetime.datetime.now(datetime.timezone.utc) - participant.status.was_online).days} days ago"
-                elif hasattr(participant.status, "expires"):
-                    status_text = "Online recently"
-                else:
-                    status_text = str(participant.status)
-
-                return {
-                    "id": participant.id,
-                    "firstName": participant.first_name,
-                    "lastName": participant.last_name,
-                    "username": participant.username,
-                    "phone": participant.phone,
-                    "status": "pending",
-                    "lastSeen": status_text,
-                }
-
-            except:
-                pass
+            return EventStream(loop, _stream_participants, stream_format), 200
 
         # Run the async function in the session's event loop
         future = asyncio.run_coroutine_threadsafe(_get_participants(), loop)
 
         # Wait for the result
-        result = future.result()
+        result = await asyncio.wrap_future(future)
 
         if not result["success"]:
-            return jsonify({"success": False, "message": result["message"]}), 500
+            return {"success": False, "message": result["message"]}, 500
 
-        return jsonify(result)
+        return result, 200
 
     except Exception as e:
         print(f"Error getting participants: {str(e)}", file=sys.stderr)
-        return jsonify({"success": False, "message": str(e)}), 500
+        return {"success": False, "message": str(e)}, 500
 
 
-@app.route("/api/inviteParticipant", methods=["POST"])
-@async_route
-async def invite_participant():
-    data = request.json
+@api_route("/api/inviteParticipant", methods=["POST"])
+async def invite_participant(data):
     session_id = data.get("sessionId")
     participant = data.get("participant")
 
     try:
         if session_id not in active_clients:
             return (
-                jsonify({"success": False, "message": "No active session found"}),
+                {"success": False, "message": "No active session found"},
                 400,
             )
 
@@ -661,12 +2625,8 @@ async def invite_participant():
         target_entity = active_clients[session_id]["target_entity"]
         is_channel = active_clients[session_id]["is_channel"]
 
-        # Make sure we have an event loop for this session
-        if session_id not in session_event_loops:
-            create_session_thread(session_id)
-
         # Get the session's event loop
-        loop = session_event_loops[session_id]
+        loop = get_session_loop(session_id)
 
         # Define the async function to run in the session's event loop
         async def _invite_participant():
@@ -697,6 +2657,8 @@ async def invite_participant():
                             fwd_limit=300,
                         )
                     )
+                record_member(target_entity, participant["id"])
+                record_invite(target_entity, participant["id"], "invited")
                 return {
                     "success": True,
                     "message": f"Successfully invited {participant['firstName'] or 'User'}",
@@ -706,47 +2668,56 @@ async def invite_participant():
                     f"Error processing {participant['firstName'] or 'User'}: {str(e)}",
                     file=sys.stderr,
                 )
+                record_invite(
+                    target_entity,
+                    participant["id"],
+                    "failed",
+                    str(e),
+                    classify_error(e),
+                )
                 return {"success": False, "message": str(e)}
 
         # Run the coroutine in the session's event loop
         future = asyncio.run_coroutine_threadsafe(_invite_participant(), loop)
 
         # Wait for the result without timeout
-        result = future.result()
-        return jsonify(result)
+        result = await asyncio.wrap_future(future)
+        return result, 200
 
     except Exception as e:
         print(f"Error inviting participant: {str(e)}", file=sys.stderr)
-        return jsonify({"success": False, "message": str(e)}), 500
+        return {"success": False, "message": str(e)}, 500
 
 
-@app.route("/api/inviteByPhoneNumbers", methods=["POST"])
-@async_route
-async def invite_by_phone_numbers():
-    data = request.json
+@api_route("/api/inviteByPhoneNumbers", methods=["POST"])
+async def invite_by_phone_numbers(data):
     session_id = data.get("sessionId")
     phone_numbers = data.get("phoneNumbers", [])
     target_group = data.get("targetGroup")
     delay_range = data.get("delayRange", {"min": 60, "max": 60})
     interactive = data.get("interactive", False)  # New parameter for interactive mode
+    invite_batch_size = min(
+        MAX_INVITE_BATCH_SIZE, max(1, int(data.get("inviteBatchSize", 1)))
+    )
+    # Participants invited at the same time in the background
+    concurrency = min(
+        MAX_INVITE_CONCURRENCY,
+        max(1, int(data.get("concurrency", INVITE_CONCURRENCY))),
+    )
 
     if session_id not in active_clients:
-        return jsonify({"success": False, "message": "No active session found"}), 400
+        return {"success": False, "message": "No active session found"}, 400
 
     client = active_clients[session_id]["client"]
 
-    # Make sure we have an event loop for this session
-    if session_id not in session_event_loops:
-        create_session_thread(session_id)
-
     # Get the session's event loop
-    loop = session_event_loops[session_id]
+    loop = get_session_loop(session_id)
 
     # Define the async function to run in the session's event loop
     async def _invite_by_phone_numbers():
         try:
             # Get target group info
-            target_entity = await client.get_input_entity(target_group)
+            target_entity = await resolve_input_entity(session_id, client, target_group)
             is_channel = isinstance(target_entity, InputPeerChannel)
 
             # Store target entity in active_clients
@@ -754,94 +2725,39 @@ async def invite_by_phone_numbers():
             active_clients[session_id]["is_channel"] = is_channel
             active_clients[session_id]["delay_range"] = delay_range
 
-            # Process phone numbers in batches to avoid overwhelming the API
-            participants = []
-            batch_size = 10  # Process 10 phone numbers at a time
-
-            # Helper function to process a single phone number
-            async def process_phone(phone):
-                try:
-                    # Clean the phone number
-                    phone = phone.strip()
-                    if not phone:
-                        return None
+            # Resolve the phone numbers with batched contact imports
+            phones = [phone.strip() for phone in phone_numbers if phone.strip()]
+            users = await import_phone_contacts(
+                client, [(phone, "User", "") for phone in phones]
+            )
 
-                    # Try to get user by phone
-                    try:
-                        from telethon.tl.functions.contacts import ImportContactsRequest
-                        from telethon.tl.types import InputPhoneContact
-
-                        result = await client(
-                            ImportContactsRequest(
-                                [
-                                    InputPhoneContact(
-                                        client_id=0,
-                                        phone=phone,
-                                        first_name="User",
-                                        last_name="",
-                                    )
-                                ]
-                            )
-                        )
-                        if result.users:
-                            user = result.users[0]
-                            return {
-                                "id": user.id,
-                                "firstName": user.first_name,
-                                "lastName": user.last_name,
-                                "username": user.username,
-                                "phone": phone,
-                                "status": "pending",
-                            }
-                        else:
-                            # Return with just the phone number for later processing
-                            return {
-                                "id": None,
-                                "firstName": None,
-                                "lastName": None,
-                                "username": None,
-                                "phone": phone,
-                                "status": "pending",
-                            }
-                    except Exception as e:
-                        print(
-                            f"Error importing contact for phone {phone}: {str(e)}",
-                            file=sys.stderr,
-                        )
-                        # Return with just the phone number
-                        return {
+            participants = []
+            for phone in phones:
+                user = users.get(phone)
+                if isinstance(user, Exception):
+                    # Not looked up, unlike a number without an account
+                    participants.append(
+                        {
                             "id": None,
                             "firstName": None,
                             "lastName": None,
                             "username": None,
                             "phone": phone,
-                            "status": "pending",
+                            "status": "failed",
+                            "error": str(user),
                         }
-                except Exception as e:
-                    print(
-                        f"Error processing phone number {phone}: {str(e)}",
-                        file=sys.stderr,
                     )
-                    return None
-
-            # Process phone numbers in batches
-            for i in range(0, len(phone_numbers), batch_size):
-                batch = phone_numbers[i : i + batch_size]
-
-                # Create tasks for each phone number in the batch
-                tasks = [asyncio.create_task(process_phone(phone)) for phone in batch]
-
-                # Gather results from all tasks
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                # Add valid participants to the list
-                for result in results:
-                    if not isinstance(result, Exception) and result is not None:
-                        participants.append(result)
-
-                # Add a small delay between batches
-                if i + batch_size < len(phone_numbers):
-                    await asyncio.sleep(2)
+                    continue
+                participants.append(
+                    {
+                        "id": user.id if user else None,
+                        "firstName": user.first_name if user else None,
+                        "lastName": user.last_name if user else None,
+                        "username": user.username if user else None,
+                        "phone": phone,
+                        "status": "pending",
+                    }
+                )
 
             # If interactive mode, just return the participants without starting background process
             if interactive:
@@ -852,21 +2768,26 @@ async def invite_by_phone_numbers():
                 }
 
             # Otherwise start background invite process
+            job = None
             if participants:
-                future = run_background_invite(
+                job = invite_jobs.create(session_id, participants)
+                run_background_invite(
                     session_id,
                     participants,
                     delay_range,
                     client,
                     target_entity,
                     is_channel,
+                    invite_batch_size,
+                    concurrency,
+                    job,
                 )
-                background_tasks[session_id] = future
 
             return {
                 "success": True,
                 "message": f"Started invite process for {len(participants)} phone numbers",
                 "participants": participants,
+                "jobId": job.job_id if job else None,
             }
         except Exception as e:
             print(f"Error in _invite_by_phone_numbers: {str(e)}", file=sys.stderr)
@@ -876,16 +2797,392 @@ async def invite_by_phone_numbers():
     future = asyncio.run_coroutine_threadsafe(_invite_by_phone_numbers(), loop)
 
     # Wait for the result
-    result = future.result()
+    result = await asyncio.wrap_future(future)
 
     if not result["success"]:
-        return jsonify({"success": False, "message": result["message"]}), 500
+        return {"success": False, "message": result["message"]}, 500
 
-    return jsonify(result)
+    return result, 200
+
+
+class InviteJob:
+    """Progress of one background invite.
+
+    Each participant's state and reason are kept as one byte each next to
+    its user ID, and recent state changes go to a fixed-size ring, so a job
+    costs the same few bytes per participant however long it runs.
+
+    Once saved, the job's definition and every participant that reaches a
+    final state are written to the local database, so an interrupted job
+    can be loaded again and resumed where it stopped.
+    """
+
+    STATES = ("queued", "resolving", "inviting", "invited", "skipped", "failed")
+    REASONS = (
+        None,
+        "no_user",
+        "already_member",
+        "privacy_restricted",
+        "permanent_error",
+        "rate_limited",
+        "transient_error",
+        "previously_invited",
+    )
+    # States from "invited" on are final
+    DONE = 3
+
+    def __init__(self, job_id: str, session_id: str, participants) -> None:
+        self.job_id = job_id
+        self.session_id = session_id
+        self.total = len(participants)
+        self.ids = array(
+            "q", (participant.get("id") or 0 for participant in participants)
+        )
+        self.states = bytearray(self.total)
+        self.reasons = bytearray(self.total)
+        self.counts = [self.total] + [0] * (len(self.STATES) - 1)
+        self.events = deque(maxlen=JOB_EVENT_BUFFER)
+        self.seq = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = "running"
+        self.paused = False
+        self.saved = False
+        self._lock = Lock()
+
+    def is_done(self, index: int) -> bool:
+        return self.states[index] >= self.DONE
+
+    def update(
+        self, index: int, state: str, reason=None, user_id=None, access_hash=None
+    ) -> None:
+        code = self.STATES.index(state)
+        reason_code = self.REASONS.index(reason)
+        with self._lock:
+            if user_id is not None:
+                self.ids[index] = user_id
+            self.counts[self.states[index]] -= 1
+            self.counts[code] += 1
+            self.states[index] = code
+            self.reasons[index] = reason_code
+            self.seq += 1
+            self.events.append((self.seq, index, code, reason_code))
+        if code >= self.DONE:
+            metrics.observe_invite(state)
+
+        # Checkpoint resolved phones and final states; in-flight ones are
+        # simply retried after a restart
+        if self.saved and (code >= self.DONE or user_id is not None):
+            try:
+                conn = get_db()
+                with conn:
+                    conn.execute(
+                        "UPDATE invite_job_items SET state = ?, reason = ?,"
+                        " user_id = COALESCE(?, user_id),"
+                        " access_hash = COALESCE(?, access_hash)"
+                        " WHERE job_id = ? AND idx = ?",
+                        (code, reason_code, user_id, access_hash, self.job_id, index),
+                    )
+            except Exception as e:
+                print(f"Error saving job {self.job_id}: {str(e)}", file=sys.stderr)
+
+    def save(self, account_id: int, target_entity, settings, participants, session):
+        """Write the job's definition and participants to the local database.
+
+        Access hashes are taken from the client's session now, because a
+        client created after a restart does not know them.
+        """
+
+        def access_hash(user_id):
+            try:
+                return session.get_input_entity(user_id).access_hash
+            except (ValueError, AttributeError):
+                return None
+
+        if isinstance(target_entity, InputPeerChannel):
+            target = ("channel", target_entity.channel_id, target_entity.access_hash)
+        else:
+            target = ("chat", target_entity.chat_id, None)
+        now = time.time()
+        conn = get_db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO invite_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.job_id,
+                    account_id,
+                    *target,
+                    json.dumps(settings),
+                    "running",
+                    now,
+                    now,
+                ),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO invite_job_items VALUES"
+                " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        self.job_id,
+                        index,
+                        participant.get("id"),
+                        participant.get("accessHash")
+                        or (
+                            access_hash(participant["id"])
+                            if participant.get("id")
+                            else None
+                        ),
+                        participant.get("firstName"),
+                        participant.get("lastName"),
+                        participant.get("username"),
+                        participant.get("phone"),
+                        self.states[index],
+                        self.reasons[index],
+                    )
+                    for index, participant in enumerate(participants)
+                ],
+            )
+        self.saved = True
+
+    @classmethod
+    def load(cls, job_id: str, session_id: str):
+        """Rebuild a saved job for session_id.
+
+        Returns the job, its participants, its target entity and its
+        settings. Participants that were in flight go back to queued.
+        """
+        conn = get_db()
+        row = conn.execute(
+            "SELECT target_type, target_id, target_hash, settings"
+            " FROM invite_jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        target_type, target_id, target_hash, settings = row
+        if target_type == "channel":
+            target_entity = InputPeerChannel(target_id, target_hash)
+        else:
+            target_entity = InputPeerChat(target_id)
+
+        rows = conn.execute(
+            "SELECT user_id, access_hash, first_name, last_name, username, phone,"
+            " state, reason FROM invite_job_items WHERE job_id = ? ORDER BY idx",
+            (job_id,),
+        ).fetchall()
+        participants = [
+            {
+                "id": user_id,
+                "accessHash": access_hash,
+                "firstName": first_name,
+                "lastName": last_name,
+                "username": username,
+                "phone": phone,
+                "status": "pending",
+            }
+            for user_id, access_hash, first_name, last_name, username, phone, _, _ in rows
+        ]
+        job = cls(job_id, session_id, participants)
+        for index, (*_, state, reason) in enumerate(rows):
+            if state >= cls.DONE:
+                job.counts[0] -= 1
+                job.counts[state] += 1
+                job.states[index] = state
+                job.reasons[index] = reason
+        job.saved = True
+        return job, participants, target_entity, json.loads(settings)
+
+    def fail(self, index: int, error: Exception) -> None:
+        """Mark a participant failed with the reason its error falls under"""
+        if isinstance(error, UserPrivacyRestrictedError):
+            reason = "privacy_restricted"
+        else:
+            reason = {
+                "permanent": "permanent_error",
+                "rate_limit": "rate_limited",
+            }.get(classify_error(error), "transient_error")
+        self.update(index, "failed", reason)
+
+    def finish(self, status: str) -> None:
+        """Mark the job finished, stopped or interrupted"""
+        self.finished_at = time.time()
+        self.status = status
+        if not self.saved:
+            return
+        try:
+            conn = get_db()
+            with conn:
+                conn.execute(
+                    "UPDATE invite_jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                    (status, self.finished_at, self.job_id),
+                )
+        except Exception as e:
+            print(f"Error saving job {self.job_id}: {str(e)}", file=sys.stderr)
+
+    def entry(self, index: int, code: int, reason_code: int) -> dict:
+        return {
+            "index": index,
+            "id": self.ids[index] or None,
+            "state": self.STATES[code],
+            "reason": self.REASONS[reason_code],
+        }
+
+    def summary(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        done = sum(self.counts[self.STATES.index(state)] for state in self.STATES[3:])
+        rate = done / elapsed if elapsed > 0 else 0.0
+        return {
+            "jobId": self.job_id,
+            "sessionId": self.session_id,
+            "total": self.total,
+            "counts": dict(zip(self.STATES, self.counts)),
+            "finished": self.finished_at is not None,
+            "status": self.status,
+            "paused": self.paused,
+            "elapsed": round(elapsed, 1),
+            "throughput": round(rate * 60, 2),  # participants per minute
+            "eta": (
+                round((self.total - done) / rate)
+                if rate > 0 and self.finished_at is None
+                else None
+            ),
+            "seq": self.seq,
+        }
+
+    def events_since(self, seq: int) -> list:
+        """Return the buffered state changes after seq, oldest first"""
+        with self._lock:
+            events = [event for event in self.events if event[0] > seq]
+        return [dict(self.entry(*event[1:]), seq=event[0]) for event in events]
+
+    def participants(self) -> list:
+        return [
+            self.entry(index, self.states[index], self.reasons[index])
+            for index in range(self.total)
+        ]
+
+
+class InviteJobRegistry:
+    """Invite jobs by ID, keeping the last JOB_HISTORY_SIZE finished ones"""
+
+    def __init__(self) -> None:
+        self.jobs = OrderedDict()
+        self._lock = Lock()
+
+    def create(self, session_id: str, participants) -> InviteJob:
+        conn = get_db()
+        while True:
+            job_id = str(random.randint(100000, 999999))
+            if (
+                job_id not in self.jobs
+                and not conn.execute(
+                    "SELECT 1 FROM invite_jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+            ):
+                break
+        return self.add(InviteJob(job_id, session_id, participants))
+
+    def add(self, job: InviteJob) -> InviteJob:
+        with self._lock:
+            self.jobs[job.job_id] = job
+            finished = [
+                key for key, other in self.jobs.items() if other.finished_at is not None
+            ]
+            for key in finished[: max(0, len(finished) - JOB_HISTORY_SIZE)]:
+                del self.jobs[key]
+        return job
+
+    def get(self, job_id) -> InviteJob:
+        return self.jobs.get(str(job_id))
+
+    def status_counts(self) -> dict:
+        counts = {}
+        for job in list(self.jobs.values()):
+            status = "paused" if job.paused and job.finished_at is None else job.status
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def is_running(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        return job is not None and job.finished_at is None
+
+    def latest(self, session_id: str) -> InviteJob:
+        """Return the most recently started job of a session"""
+        with self._lock:
+            jobs = [job for job in self.jobs.values() if job.session_id == session_id]
+        return jobs[-1] if jobs else None
+
+
+invite_jobs = InviteJobRegistry()
+
+
+class BackgroundInvite:
+    """Handle on a background invite task running on its session's loop.
+
+    Stop, pause and resume come from request threads and are handed to the
+    loop: stopping cancels the task, which interrupts whatever sleep or
+    request it is waiting on, and pausing holds every worker before its next
+    participant. Once the task ends, a stopped or finished invite releases
+    its session unless another invite has taken the session over.
+    """
+
+    def __init__(self, session_id: str, loop, job: InviteJob) -> None:
+        self.session_id = session_id
+        self.loop = loop
+        self.job = job
+        self.task = None
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.future = concurrent.futures.Future()
+
+    def start(self, coro) -> None:
+        """Run coro as the invite task; must be called on the session loop"""
+        self.task = self.loop.create_task(coro)
+        self.task.add_done_callback(self._done)
+
+    def _done(self, task) -> None:
+        # A task cancelled before its first step never ran its own cleanup
+        if self.job.finished_at is None:
+            self.job.finish("stopped")
+        if background_tasks.get(self.session_id) is self:
+            del background_tasks[self.session_id]
+            print(
+                f"Background task for session {self.session_id} completed",
+                file=sys.stderr,
+            )
+            # An interrupted job keeps its session so it can be resumed
+            if self.job.status in ("finished", "stopped"):
+                cleanup_session(self.session_id)
+        self.future.set_result(self.job.status)
+
+    def cancel(self) -> bool:
+        if self.task is None or self.task.done():
+            return False
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        return True
+
+    def pause(self) -> None:
+        self.job.paused = True
+        self.loop.call_soon_threadsafe(self.resumed.clear)
+
+    def resume(self) -> None:
+        self.job.paused = False
+        self.loop.call_soon_threadsafe(self.resumed.set)
+
+    def done(self) -> bool:
+        return self.future.done()
 
 
 def run_background_invite(
-    session_id, participants, delay_range, client, target_entity, is_channel
+    session_id,
+    participants,
+    delay_range,
+    client,
+    target_entity,
+    is_channel,
+    invite_batch_size=1,
+    concurrency=INVITE_CONCURRENCY,
+    job=None,
 ):
     print(f"Running background invite for session {session_id}", file=sys.stderr)
 
@@ -898,99 +3195,248 @@ def run_background_invite(
     session_loop = session_event_loops[session_id]
     print(f"Using event loop for session {session_id}: {session_loop}", file=sys.stderr)
 
-    # Create a future to track completion
-    result_future = concurrent.futures.Future()
+    # Track each participant's progress for the status endpoints
+    if job is None:
+        job = invite_jobs.create(session_id, participants)
+    handle = BackgroundInvite(session_id, session_loop, job)
 
     # Define the async function to run in the session's event loop
     async def _invite_participants():
         print(f"Inviting participants in session {session_id}", file=sys.stderr)
+        # Background invites can afford to sit out long flood waits
+        max_flood_wait.set(BACKGROUND_MAX_FLOOD_WAIT)
+        status = "interrupted"
         try:
-            # Process participants in batches to avoid overwhelming the API
-            batch_size = 5  # Process 5 participants at a time
-            for i in range(0, len(participants), batch_size):
-                batch = participants[i : i + batch_size]
-
-                # Create tasks for each participant in the batch
-                tasks = []
-                for participant in batch:
-                    task = asyncio.create_task(_process_participant(participant))
-                    tasks.append(task)
-
-                # Wait for all tasks in the batch to complete
-                await asyncio.gather(*tasks, return_exceptions=True)
-
-                # Add a small delay between batches
-                await asyncio.sleep(5)
-        finally:
-            # Clean up when done
-            if session_id in background_tasks:
-                del background_tasks[session_id]
-                print(
-                    f"Background task for session {session_id} completed",
-                    file=sys.stderr,
+            if not job.saved:
+                job.save(
+                    await get_account_id(session_id, client),
+                    target_entity,
+                    {
+                        "delayRange": delay_range,
+                        "inviteBatchSize": invite_batch_size,
+                        "concurrency": concurrency,
+                    },
+                    participants,
+                    client.session,
                 )
 
-            # Clean up session resources when background invite is finished
-            cleanup_session(session_id)
-
-            # Set the result in the future
-            result_future.set_result(True)
-
-    # Helper function to process a single participant
-    async def _process_participant(participant):
-        try:
-            # For phone-only participants, try to import contact first
-            if participant.get("id") is None and participant.get("phone"):
-                try:
-                    # Import contact
-                    from telethon.tl.functions.contacts import ImportContactsRequest
-                    from telethon.tl.types import InputPhoneContact
-
-                    result = await client(
-                        ImportContactsRequest(
-                            [
-                                InputPhoneContact(
-                                    client_id=0,
-                                    phone=participant["phone"],
-                                    first_name=participant.get("firstName") or "User",
-                                    last_name=participant.get("lastName") or "",
-                                )
-                            ]
+            # Participants finished before a restart are not touched again
+            pending = [
+                index for index in range(len(participants)) if not job.is_done(index)
+            ]
+
+            # Resolve phone-only participants up front with batched imports
+            phone_only = [
+                index
+                for index in pending
+                if participants[index].get("id") is None
+                and participants[index].get("phone")
+            ]
+            for index in phone_only:
+                job.update(index, "resolving")
+            rate_limited = None
+            unresolved = set()
+            if phone_only:
+                users = await import_phone_contacts(
+                    client,
+                    [
+                        (
+                            participants[index]["phone"],
+                            participants[index].get("firstName") or "User",
+                            participants[index].get("lastName") or "",
                         )
-                    )
-
-                    if result.users:
-                        # Update participant with user info
-                        user = result.users[0]
-                        participant["id"] = user.id
-                        participant["firstName"] = user.first_name
-                        participant["lastName"] = user.last_name
-                        participant["username"] = user.username
+                        for index in phone_only
+                    ],
+                )
+                for index in phone_only:
+                    participant = participants[index]
+                    user = users.get(participant["phone"])
+                    if isinstance(user, Exception):
                         print(
-                            f"Successfully imported contact: {participant['phone']}",
+                            f"Could not look up phone {participant['phone']}: {str(user)}",
                             file=sys.stderr,
                         )
-                    else:
+                        if classify_error(user) == "rate_limit":
+                            # Looked up again when the interrupted job resumes
+                            job.update(index, "queued")
+                            unresolved.add(index)
+                            rate_limited = user
+                        else:
+                            job.fail(index, user)
+                        continue
+                    if user is None:
                         print(
                             f"No user found for phone: {participant['phone']}",
                             file=sys.stderr,
                         )
-                        return
-                except Exception as e:
+                        job.update(index, "skipped", "no_user")
+                        continue
+                    job.update(
+                        index,
+                        "queued",
+                        user_id=user.id,
+                        access_hash=user.access_hash,
+                    )
+                    participant["id"] = user.id
+                    participant["firstName"] = user.first_name
+                    participant["lastName"] = user.last_name
+                    participant["username"] = user.username
                     print(
-                        f"Error importing contact {participant['phone']}: {str(e)}",
+                        f"Successfully imported contact: {participant['phone']}",
                         file=sys.stderr,
                     )
-                    return
+                pending = [index for index in pending if index not in unresolved]
+
+            if is_channel and invite_batch_size > 1:
+                # Invite several users with each InviteToChannelRequest
+                await run_workers(
+                    [
+                        pending[i : i + invite_batch_size]
+                        for i in range(0, len(pending), invite_batch_size)
+                    ],
+                    _invite_batch,
+                    concurrency,
+                    handle.resumed,
+                    RATE_LIMIT_ERRORS,
+                )
+            else:
+                # Keep a fixed number of participants in flight
+                await run_workers(
+                    pending,
+                    _process_participant,
+                    concurrency,
+                    handle.resumed,
+                    RATE_LIMIT_ERRORS,
+                )
+            if rate_limited is not None:
+                # Ends the job interrupted, with the rest of it done
+                raise rate_limited
+            status = "finished"
+        except asyncio.CancelledError:
+            status = "stopped"
+            raise
+        except Exception as e:
+            print(
+                f"Background invite {job.job_id} interrupted: {str(e)}", file=sys.stderr
+            )
+        finally:
+            job.finish(status)
+
+    # Helper function to invite a batch of participants with one request
+    async def _invite_batch(indexes):
+        batch = []
+        for index in indexes:
+            participant = participants[index]
+            if job.is_done(index):
+                continue
+            if participant.get("id") is None:
+                job.update(index, "skipped", "no_user")
+            elif is_known_member(target_entity, participant["id"]):
+                job.update(index, "skipped", "already_member")
+            else:
+                job.update(index, "inviting")
+                batch.append((index, participant))
+        if not batch:
+            return
 
+        try:
+            result = await client(
+                InviteToChannelRequest(
+                    channel=target_entity,
+                    users=[participant["id"] for _, participant in batch],
+                )
+            )
+        except RATE_LIMIT_ERRORS:
+            # Stop the run; the batch is tried again when the job is resumed
+            for index, _ in batch:
+                job.update(index, "queued")
+            raise
+        except Exception as e:
+            # Fall back to one request per user to get each user's outcome
+            print(
+                f"Batch invite of {len(batch)} users failed, inviting one by one: {str(e)}",
+                file=sys.stderr,
+            )
+            for position, (index, _) in enumerate(batch):
+                try:
+                    await _process_participant(index)
+                except RATE_LIMIT_ERRORS:
+                    for rest, _ in batch[position + 1 :]:
+                        job.update(rest, "queued")
+                    raise
+            return
+
+        # Users whose privacy settings blocked the invite come back as missing,
+        # and the ones added show up in the service message, if there is one.
+        # Users who already were members are left out of both; without a
+        # service message they cannot be told apart and count as invited
+        missing = {
+            invitee.user_id for invitee in getattr(result, "missing_invitees", [])
+        }
+        added = invited_user_ids(getattr(result, "updates", None))
+        for index, participant in batch:
+            if participant["id"] in missing:
+                print(
+                    f"Failed to invite {participant['firstName'] or 'User'}: privacy settings",
+                    file=sys.stderr,
+                )
+                record_invite(
+                    target_entity,
+                    participant["id"],
+                    "failed",
+                    "Privacy settings prevent inviting this user",
+                    "permanent",
+                )
+                job.update(index, "failed", "privacy_restricted")
+            elif added is None or participant["id"] in added:
+                record_member(target_entity, participant["id"])
+                record_invite(target_entity, participant["id"], "invited")
+                job.update(index, "invited")
+                print(
+                    f"Successfully invited {participant['firstName'] or 'User'}",
+                    file=sys.stderr,
+                )
+            else:
+                record_member(target_entity, participant["id"])
+                record_invite(
+                    target_entity, participant["id"], "skipped", "Already a member"
+                )
+                job.update(index, "skipped", "already_member")
+                print(
+                    f"Skipping {participant['firstName'] or 'User'}, already a member",
+                    file=sys.stderr,
+                )
+
+        # Random delay between invites
+        delay_seconds = random.randint(delay_range["min"], delay_range["max"])
+        await asyncio.sleep(delay_seconds)
+
+    # Helper function to process a single participant
+    async def _process_participant(index):
+        participant = participants[index]
+        if job.is_done(index):
+            return
+        try:
             # Skip if we still don't have an ID
             if participant.get("id") is None:
                 print(
                     f"Skipping participant with no ID: {participant.get('phone')}",
                     file=sys.stderr,
                 )
+                job.update(index, "skipped", "no_user")
                 return
 
+            # Skip users who are already in the target group
+            if is_known_member(target_entity, participant["id"]):
+                print(
+                    f"Skipping {participant['firstName'] or 'User'}, already a member",
+                    file=sys.stderr,
+                )
+                job.update(index, "skipped", "already_member")
+                return
+
+            job.update(index, "inviting")
+
             # Add to contacts with retry mechanism
             max_retries = 3
             for attempt in range(max_retries):
@@ -1006,14 +3452,26 @@ def run_background_invite(
                     )
                     break
                 except Exception as e:
-                    if attempt == max_retries - 1:
+                    kind = classify_error(e)
+                    if kind == "rate_limit":
+                        # Stop the run; this participant is tried again on resume
+                        job.update(index, "queued")
+                        raise
+                    # Inviting can still succeed without the contact, so a
+                    # permanent failure here only stops retrying it
+                    if attempt == max_retries - 1 or kind == "permanent":
                         print(
                             f"Failed to add contact {participant['firstName'] or 'User'}: {str(e)}",
                             file=sys.stderr,
                         )
-                    await asyncio.sleep(30)
-
-            # Invite to group with retry mechanism
+                        break
+                    await asyncio.sleep(RETRY_DELAY)
+
+            # Invite to group with retry mechanism; flood waits are already
+            # sat out by the client's pacer before it raises
+            invite_method = (
+                InviteToChannelRequest if is_channel else AddChatUserRequest
+            ).__name__
             for attempt in range(max_retries):
                 try:
                     if is_channel:
@@ -1030,57 +3488,100 @@ def run_background_invite(
                                 fwd_limit=300,
                             )
                         )
+                    record_member(target_entity, participant["id"])
+                    record_invite(target_entity, participant["id"], "invited")
+                    job.update(index, "invited")
                     print(
                         f"Successfully invited {participant['firstName'] or 'User'}",
                         file=sys.stderr,
                     )
                     break
+                except UserAlreadyParticipantError:
+                    record_member(target_entity, participant["id"])
+                    record_invite(
+                        target_entity, participant["id"], "skipped", "Already a member"
+                    )
+                    job.update(index, "skipped", "already_member")
+                    print(
+                        f"Skipping {participant['firstName'] or 'User'}, already a member",
+                        file=sys.stderr,
+                    )
+                    return
                 except Exception as e:
-                    if attempt == max_retries - 1:
+                    kind = classify_error(e)
+                    if kind == "rate_limit" and (
+                        attempt == max_retries - 1 or not isinstance(e, PeerFloodError)
+                    ):
+                        # Telegram wants a longer break than this run waits
+                        # out, so stop it; the job ends interrupted and keeps
+                        # its session, and this participant is tried again
+                        # when it is resumed
+                        job.update(index, "queued")
+                        raise
+                    if attempt == max_retries - 1 or kind == "permanent":
                         print(
                             f"Failed to invite {participant['firstName'] or 'User'}: {str(e)}",
                             file=sys.stderr,
                         )
-                        await asyncio.sleep(60)  # Longer wait on final failure
-                    else:
-                        await asyncio.sleep(30)  # Wait between retries
+                        record_invite(
+                            target_entity, participant["id"], "failed", str(e), kind
+                        )
+                        job.fail(index, e)
+                        # Nothing was sent that needs spacing out from the next invite
+                        if kind == "permanent":
+                            return
+                        break
+                    if isinstance(e, PeerFloodError):
+                        # Hold back every invite of this session, not just this one
+                        client.pacer.block(invite_method, PEER_FLOOD_DELAY)
+                    elif kind == "transient":
+                        await asyncio.sleep(RETRY_DELAY)  # Wait between retries
 
             # Random delay between invites
             delay_seconds = random.randint(delay_range["min"], delay_range["max"])
             await asyncio.sleep(delay_seconds)
 
+        except RATE_LIMIT_ERRORS:
+            raise
         except Exception as e:
             print(
                 f"Error processing {participant['firstName'] or 'User'}: {str(e)}",
                 file=sys.stderr,
             )
-            await asyncio.sleep(60)
+            job.fail(index, e)
 
     # Run the async function in the session's event loop
     def start_invite_process():
         try:
-            # Set the event loop for this thread
-            asyncio.set_event_loop(session_loop)
-
             # Create and run the task
-            task = session_loop.create_task(_invite_participants())
+            handle.start(_invite_participants())
         except Exception as e:
             print(f"Error starting invite process: {str(e)}", file=sys.stderr)
-            result_future.set_exception(e)
+            handle.future.set_exception(e)
 
     # Schedule the function to run in the session's thread
+    # Registered before the task starts, so a run that ends at once (such as
+    # one stopped by a flood wait) still finds itself here and cleans up
+    background_tasks[session_id] = handle
     session_loop.call_soon_threadsafe(start_invite_process)
 
-    return result_future
+    return handle
 
 
-@app.route("/api/startBackgroundInvite", methods=["POST"])
-@async_route
-async def start_background_invite():
-    data = request.json
+@api_route("/api/startBackgroundInvite", methods=["POST"])
+async def start_background_invite(data):
     session_id = data.get("sessionId")
     delay_range = data.get("delayRange", {"min": 60, "max": 60})
     participants = data.get("participants")
+    # Users per InviteToChannelRequest; 1 keeps one request per user
+    invite_batch_size = min(
+        MAX_INVITE_BATCH_SIZE, max(1, int(data.get("inviteBatchSize", 1)))
+    )
+    # Participants invited at the same time in the background
+    concurrency = min(
+        MAX_INVITE_CONCURRENCY,
+        max(1, int(data.get("concurrency", INVITE_CONCURRENCY))),
+    )
 
     print(
         f"startBackgroundInvite called for session {session_id} with {len(participants) if participants else 0} participants",
@@ -1089,18 +3590,11 @@ async def start_background_invite():
 
     if session_id not in active_clients:
         print(f"No active session found for session {session_id}", file=sys.stderr)
-        return jsonify({"success": False, "message": "No active session found"}), 400
+        return {"success": False, "message": "No active session found"}, 400
 
     print(f"Active client found for session {session_id}", file=sys.stderr)
 
-    if session_id not in session_event_loops:
-        print(f"No event loop found for session {session_id}", file=sys.stderr)
-        # Create a new thread and event loop for this session
-        create_session_thread(session_id)
-        print(
-            f"Created new event loop for session {session_id}: {session_event_loops[session_id]}",
-            file=sys.stderr,
-        )
+    get_session_loop(session_id)
 
     client = active_clients[session_id]["client"]
     target_entity = active_clients[session_id].get("target_entity")
@@ -1113,11 +3607,11 @@ async def start_background_invite():
 
     if not target_entity:
         print(f"No target entity found for session {session_id}", file=sys.stderr)
-        return jsonify({"success": False, "message": "No target group selected"}), 400
+        return {"success": False, "message": "No target group selected"}, 400
 
     if not participants:
         print(f"No participants to invite for session {session_id}", file=sys.stderr)
-        return jsonify({"success": False, "message": "No participants to invite"}), 400
+        return {"success": False, "message": "No participants to invite"}, 400
 
     try:
         print(
@@ -1144,25 +3638,28 @@ async def start_background_invite():
         print(
             f"Calling run_background_invite for session {session_id}", file=sys.stderr
         )
+        job = invite_jobs.create(session_id, participants)
         future = run_background_invite(
-            session_id, participants, delay_range, client, target_entity, is_channel
+            session_id,
+            participants,
+            delay_range,
+            client,
+            target_entity,
+            is_channel,
+            invite_batch_size,
+            concurrency,
+            job,
         )
         print(
             f"Background task created for session {session_id}: {future}",
             file=sys.stderr,
         )
-        background_tasks[session_id] = future
-        print(
-            f"Background task stored in background_tasks for session {session_id}",
-            file=sys.stderr,
-        )
 
-        return jsonify(
-            {
-                "success": True,
-                "message": f"Background invite process started for {len(participants)} participants",
-            }
-        )
+        return {
+            "success": True,
+            "message": f"Background invite process started for {len(participants)} participants",
+            "jobId": job.job_id,
+        }, 200
 
     except Exception as e:
         print(
@@ -1172,7 +3669,238 @@ async def start_background_invite():
         import traceback
 
         traceback.print_exc(file=sys.stderr)
-        return jsonify({"success": False, "message": str(e)}), 500
+        return {"success": False, "message": str(e)}, 500
+
+
+def find_job(data):
+    """Return the job named by jobId, or the session's latest job"""
+    if data.get("jobId"):
+        job = invite_jobs.get(data["jobId"])
+        if job is not None and job.session_id == data.get("sessionId"):
+            return job
+        return None
+    return invite_jobs.latest(data.get("sessionId"))
+
+
+@api_route("/api/inviteStatus", methods=["POST"])
+async def invite_status(data):
+    """Report the progress of a background invite.
+
+    Returns the job's counts, throughput and ETA, plus the state changes
+    after ``after`` that are still buffered. ``includeParticipants`` adds
+    every participant's current state.
+    """
+    job = find_job(data)
+    if job is None:
+        return {"success": False, "message": "No invite job found"}, 404
+
+    result = {"success": True, **job.summary()}
+    result["events"] = job.events_since(int(data.get("after", 0)))
+    if data.get("includeParticipants"):
+        result["participants"] = job.participants()
+    return result, 200
+
+
+@api_route("/api/inviteEvents", methods=["GET"])
+async def invite_events(data):
+    """Stream a background invite's progress as Server-Sent Events"""
+    job = find_job(data)
+    if job is None:
+        return {"success": False, "message": "No invite job found"}, 404
+    stream_format = data.get("format", "sse")
+    if stream_format not in EventStream.MIMETYPES:
+        return {
+            "success": False,
+            "message": f"Unknown stream format {stream_format}",
+        }, 400
+
+    async def _stream_progress(emit):
+        seq = int(data.get("after", 0))
+        while True:
+            finished = job.finished_at is not None
+            for event in job.events_since(seq):
+                seq = event["seq"]
+                await emit({"type": "participant", **event})
+            await emit({"type": "progress", **job.summary()})
+            if finished:
+                return
+            await asyncio.sleep(JOB_PROGRESS_INTERVAL)
+
+    loop = loop_pool.loop_for(job.session_id)
+    return EventStream(loop, _stream_progress, stream_format), 200
+
+
+@api_route("/api/metrics", methods=["GET"])
+async def get_metrics(data):
+    """Serve the process metrics in the Prometheus text format"""
+    return metrics.render(), 200
+
+
+def session_rpc(client_info) -> dict:
+    """Requests of a session sent and queued, in total and by type"""
+    pacer = getattr(client_info.get("client"), "pacer", None)
+    if pacer is None:
+        return {}
+    return {
+        "inFlight": pacer.in_flight.in_flight,
+        "queued": pacer.in_flight.waiting,
+        "methods": {
+            method: {"inFlight": limit.in_flight, "queued": limit.waiting}
+            for method, limit in list(pacer.limits.items())
+            if limit.in_flight or limit.waiting
+        },
+    }
+
+
+@api_route("/api/sessions", methods=["GET"])
+async def list_sessions(data):
+    """Report the caller's session and totals over all connected sessions.
+
+    Session IDs are what every other endpoint trusts, so only the session
+    named in the request is described; the rest are aggregated, as in
+    /api/metrics.
+    """
+    now = time.monotonic()
+    session_id = data.get("sessionId")
+    client_info = active_clients.get(session_id) if session_id else None
+    session = None
+    if client_info is not None:
+        session = {
+            "sessionId": session_id,
+            "idleSeconds": round(now - client_info.get("last_used", now)),
+            "backgroundInvite": session_id in background_tasks,
+            # Not counting this request
+            "requests": session_requests.get(session_id, 1) - 1,
+            "memoryBytes": session_memory(client_info),
+            "rpc": session_rpc(client_info),
+        }
+    clients = list(active_clients.values())
+    return {
+        "success": True,
+        "session": session,
+        "totals": {
+            "sessions": len(clients),
+            "backgroundInvites": len(background_tasks),
+            "requests": sum(session_requests.values()),
+            "memoryBytes": sum(session_memory(info) for info in clients),
+        },
+        "residentBytes": process_rss(),
+        "limits": {
+            "idleTtl": SESSION_IDLE_TTL,
+            "maxSessions": MAX_SESSIONS or None,
+            "maxMemoryMb": MAX_MEMORY_MB or None,
+            "rpcConcurrency": RPC_CONCURRENCY or None,
+        },
+    }, 200
+
+
+@api_route("/api/pause", methods=["POST"])
+async def pause_process(data):
+    session_id = data.get("sessionId")
+    handle = background_tasks.get(session_id)
+    if handle is None or handle.done():
+        return {"success": False, "message": "No active process found"}, 400
+    handle.pause()
+    return {"success": True, "message": "Background process paused"}, 200
+
+
+@api_route("/api/resume", methods=["POST"])
+async def resume_process(data):
+    session_id = data.get("sessionId")
+    handle = background_tasks.get(session_id)
+    if handle is None or handle.done():
+        return {"success": False, "message": "No active process found"}, 400
+    handle.resume()
+    return {"success": True, "message": "Background process resumed"}, 200
+
+
+@api_route("/api/resumeInterruptedJobs", methods=["POST"])
+async def resume_interrupted_jobs(data):
+    """Resume a background invite that a restart or an error cut short.
+
+    Jobs are saved per Telegram account, so any connected session of the
+    account that started the job can resume it. Takes the job named by
+    jobId, or the account's oldest interrupted job.
+    """
+    session_id = data.get("sessionId")
+    job_id = data.get("jobId")
+
+    if session_id not in active_clients:
+        return {"success": False, "message": "No active session found"}, 400
+    if session_id in background_tasks:
+        return {
+            "success": False,
+            "message": "A background invite is already running for this session",
+        }, 409
+
+    client = active_clients[session_id]["client"]
+    loop = get_session_loop(session_id)
+
+    async def _resume():
+        account_id = await get_account_id(session_id, client)
+        rows = get_db().execute(
+            "SELECT job_id, status FROM invite_jobs"
+            " WHERE account_id = ? AND status != 'finished' ORDER BY created_at",
+            (account_id,),
+        )
+        interrupted = [
+            row_job_id
+            for row_job_id, status in rows
+            if not invite_jobs.is_running(row_job_id)
+            and (status != "stopped" or row_job_id == job_id)
+        ]
+        if job_id is not None and str(job_id) not in interrupted:
+            return {"success": False, "message": "No interrupted job found"}, 404
+        if not interrupted:
+            return {
+                "success": True,
+                "message": "No interrupted jobs",
+                "jobId": None,
+            }, 200
+
+        resume_id = str(job_id) if job_id is not None else interrupted[0]
+        job, participants, target_entity, settings = InviteJob.load(
+            resume_id, session_id
+        )
+
+        # Let the new client resolve the saved users by ID
+        client.session.process_entities(
+            [
+                User(id=participant["id"], access_hash=participant["accessHash"])
+                for participant in participants
+                if participant["id"] and participant["accessHash"]
+            ]
+        )
+
+        # An invite can have gone through right before the interruption
+        invited = load_invited_ids(target_entity)
+        for index, participant in enumerate(participants):
+            if not job.is_done(index) and participant["id"] in invited:
+                job.update(index, "skipped", "previously_invited")
+
+        invite_jobs.add(job)
+        run_background_invite(
+            session_id,
+            participants,
+            settings["delayRange"],
+            client,
+            target_entity,
+            isinstance(target_entity, InputPeerChannel),
+            settings["inviteBatchSize"],
+            settings["concurrency"],
+            job,
+        )
+        print(
+            f"Resumed invite job {resume_id} in session {session_id}", file=sys.stderr
+        )
+        return {
+            "success": True,
+            "message": f"Resumed invite job with {job.total - sum(job.counts[InviteJob.DONE :])} participants left",
+            "jobId": resume_id,
+            "interruptedJobs": [other for other in interrupted if other != resume_id],
+        }, 200
+
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_resume(), loop))
 
 
 def run_app():
@@ -1183,13 +3911,16 @@ def run_app():
     except Exception as e:
         print(f"Error running Flask app: {str(e)}", file=sys.stderr)
     finally:
-        # Clean up all sessions when the app is shutting down
-        for session_id in list(session_event_loops.keys()):
-            cleanup_session(session_id)
-        main_loop.close()
+        clean_up_app()
 
 
 def clean_up_app():
-    for session_id in list(session_event_loops.keys()):
-        cleanup_session(session_id)
-        main_loop.close()
+    # Clean up all sessions when the app is shutting down, and give their
+    # clients time to disconnect before the loops they run on are stopped
+    session_ids = set(session_event_loops) | set(active_clients)
+    disconnects = [cleanup_session(session_id) for session_id in session_ids]
+    concurrent.futures.wait(
+        [future for future in disconnects if future is not None],
+        DISCONNECT_TIMEOUT,
+    )
+    loop_pool.shutdown()
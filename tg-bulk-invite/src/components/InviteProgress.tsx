@@ -1,9 +1,10 @@
 import React from 'react';
+import { InviteJobSummary } from '@/services/telegramService';
 
 interface Participant {
   id: number;
   firstName: string | null;
-  status: 'invited' | 'skipped' | 'pending';
+  status: 'invited' | 'skipped' | 'pending' | 'failed';
 }
 
 interface Stats {
@@ -15,9 +16,12 @@ interface Stats {
 interface InviteProgressProps {
   participants: Participant[];
   stats: Stats;
+  // Set while following a background invite job
+  job?: InviteJobSummary | null;
+  onResume?: () => void;
 }
 
-export default function InviteProgress({ participants, stats }: InviteProgressProps) {
+export default function InviteProgress({ participants, stats, job, onResume }: InviteProgressProps) {
   const getStatusBadge = (status: string) => {
     switch (status) {
       case 'invited':
@@ -32,6 +36,12 @@ export default function InviteProgress({ participants, stats }: InviteProgressPr
             Skipped
           </span>
         );
+      case 'failed':
+        return (
+          <span className="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-red-100 text-red-800">
+            Failed
+          </span>
+        );
       default:
         return (
           <span className="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-gray-100 text-gray-800">
@@ -59,6 +69,23 @@ export default function InviteProgress({ participants, stats }: InviteProgressPr
             <div className="text-sm text-yellow-500">Skipped</div>
           </div>
         </div>
+        {job && (
+          <div className="mt-3 flex items-center justify-between text-sm text-gray-500">
+            <span>
+              {job.finished ? `Job ${job.status}` : job.paused ? 'Paused' : 'Running'}
+              {' · '}{job.throughput} per minute
+              {job.eta !== null && ` · about ${Math.ceil(job.eta / 60)} min left`}
+            </span>
+            {job.status === 'interrupted' && onResume && (
+              <button
+                onClick={onResume}
+                className="px-3 py-1 rounded-md text-sm font-medium text-white bg-indigo-600 hover:bg-indigo-700"
+              >
+                Resume
+              </button>
+            )}
+          </div>
+        )}
       </div>
 
       <div className="mt-6">
@@ -79,8 +106,8 @@ export default function InviteProgress({ participants, stats }: InviteProgressPr
               </tr>
             </thead>
             <tbody className="bg-white divide-y divide-gray-200">
-              {participants.map((participant) => (
-                <tr key={participant.id}>
+              {participants.map((participant, index) => (
+                <tr key={index}>
                   <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
                     {participant.firstName || 'Unknown User'}
                   </td>
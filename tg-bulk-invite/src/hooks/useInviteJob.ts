@@ -0,0 +1,69 @@
+import { useState, useEffect, useRef } from 'react';
+import {
+  telegramService,
+  InviteEvent,
+  InviteJobSummary,
+  InviteState,
+} from '@/services/telegramService';
+
+export type ParticipantStatus = 'pending' | 'invited' | 'skipped' | 'failed';
+
+const toStatus = (state: InviteState): ParticipantStatus =>
+  state === 'invited' || state === 'skipped' || state === 'failed' ? state : 'pending';
+
+// Follows a background invite job through its event stream. onParticipant is
+// called with the job index and new status of each participant that changes.
+export function useInviteJob(
+  sessionId: string,
+  jobId: string | null,
+  onParticipant: (index: number, status: ParticipantStatus) => void
+) {
+  const [progress, setProgress] = useState<InviteJobSummary | null>(null);
+  // Bumped to reopen the stream once a job is resumed
+  const [generation, setGeneration] = useState(0);
+  const onParticipantRef = useRef(onParticipant);
+  onParticipantRef.current = onParticipant;
+
+  useEffect(() => {
+    setProgress(null);
+    if (!sessionId || !jobId) return;
+
+    const source = telegramService.inviteEvents(sessionId, jobId);
+    const applyEvents = (events: InviteEvent[]) => {
+      events.forEach(event => onParticipantRef.current(event.index, toStatus(event.state)));
+    };
+
+    source.addEventListener('participant', (e) => {
+      applyEvents([JSON.parse((e as MessageEvent).data)]);
+    });
+    source.addEventListener('progress', (e) => {
+      const summary: InviteJobSummary = JSON.parse((e as MessageEvent).data);
+      setProgress(summary);
+      // The server ends the stream here; stop the browser reconnecting
+      if (summary.finished) source.close();
+    });
+    source.onerror = () => {
+      // Events may have been missed while the stream was down, so catch up
+      // from a full snapshot; the browser reconnects on its own
+      telegramService
+        .getInviteStatus({ sessionId, jobId, includeParticipants: true })
+        .then(status => {
+          applyEvents(status.participants || []);
+          setProgress(status);
+          if (status.finished) source.close();
+        })
+        .catch(() => source.close());
+    };
+
+    return () => source.close();
+  }, [sessionId, jobId, generation]);
+
+  // Continue an interrupted job, such as one stopped by a long flood wait
+  const resume = async () => {
+    if (!jobId) return;
+    await telegramService.resumeInterruptedJobs({ sessionId, jobId });
+    setGeneration(prev => prev + 1);
+  };
+
+  return { progress, resume };
+}
@@ -8,7 +8,10 @@ export interface InvitedUser {
 
 const COOKIE_NAME = 'invitedUsers';
 
-export function useInvitedUsers(targetGroup: string | null) {
+// Invite history used to be kept in a cookie. The server now keeps its own
+// ledger, so this only holds what older versions left behind until it has
+// been sent to the server once.
+export function useInvitedUsers() {
   const [invitedUsers, setInvitedUsers] = useState<InvitedUser[]>([]);
 
   // Load invited users from cookie when component mounts
@@ -20,63 +23,33 @@ export function useInvitedUsers(targetGroup: string | null) {
           setInvitedUsers(JSON.parse(stored));
         } catch (e) {
           console.error('Error parsing cookie data:', e);
-          setInvitedUsers([]);
+          Cookies.remove(COOKIE_NAME);
         }
       }
     }
   }, []);
 
-  // Save to cookie whenever invitedUsers changes
-  useEffect(() => {
-    if (typeof window !== 'undefined') {
-      try {
-        // Cookies have size limits, so we'll keep only the last 1000 entries
-        const limitedUsers = invitedUsers.slice(-1000);
-        Cookies.set(COOKIE_NAME, JSON.stringify(limitedUsers), {
-          sameSite: 'strict',
-          secure: process.env.NODE_ENV === 'production'
-        });
-      } catch (e) {
-        console.error('Error saving to cookie:', e);
-      }
-    }
-  }, [invitedUsers]);
-
-  const addInvitedUser = (user: { id: number }, groupId: string) => {
-    setInvitedUsers(prev => {
-      // Check if user is already invited to this group
-      const exists = prev.some(u => u.id === user.id && u.groupId === groupId);
-      if (exists) return prev;
-
-      // Add new user and remove oldest entries if we exceed 1000
-      const newUsers = [...prev, {
-        id: user.id,
-        groupId
-      }];
-
-      // Keep only the last 1000 entries
-      return newUsers.slice(-1000);
-    });
-  };
-
-  const isUserInvited = (userId: number, groupId: string) => {
-    return invitedUsers.some(u => u.id === userId && u.groupId === groupId);
-  };
-
   const getInvitedUsersForGroup = (groupId: string) => {
     return invitedUsers.filter(u => u.groupId === groupId);
   };
 
-  const clearInvitedUsers = () => {
-    setInvitedUsers([]);
-    Cookies.remove(COOKIE_NAME);
+  // Drop a group's entries once the server has stored them in its ledger
+  const forgetInvitedUsers = (groupId: string) => {
+    const remaining = invitedUsers.filter(u => u.groupId !== groupId);
+    if (remaining.length === invitedUsers.length) return;
+    setInvitedUsers(remaining);
+    if (remaining.length) {
+      Cookies.set(COOKIE_NAME, JSON.stringify(remaining), {
+        sameSite: 'strict',
+        secure: process.env.NODE_ENV === 'production'
+      });
+    } else {
+      Cookies.remove(COOKIE_NAME);
+    }
   };
 
   return {
-    invitedUsers,
-    addInvitedUser,
-    isUserInvited,
     getInvitedUsersForGroup,
-    clearInvitedUsers
+    forgetInvitedUsers
   };
-} 
\ No newline at end of file
+}
@@ -6,6 +6,7 @@ import { telegramService } from "@/services/telegramService";
 import GroupSelectionForm from "@/components/GroupSelectionForm";
 import InviteProgress from "@/components/InviteProgress";
 import { useInvitedUsers } from '@/hooks/useInvitedUsers';
+import { useInviteJob } from '@/hooks/useInviteJob';
 import PhoneNumberInviteForm from "@/components/PhoneNumberInviteForm";
 
 interface Participant {
@@ -21,6 +22,10 @@ interface Stats {
   skipped: number;
 }
 
+// Resume tokens are kept per phone number in this browser only
+const resumeTokenKey = (phoneNumber: string) =>
+  `tgResumeToken:${phoneNumber.replace(/\D/g, '')}`;
+
 export default function Home() {
   const [status, setStatus] = useState<{
     message: string;
@@ -39,10 +44,35 @@ export default function Home() {
   const [stats, setStats] = useState<Stats>({ total: 0, invited: 0, skipped: 0 });
   const [isProcessing, setIsProcessing] = useState(false);
   const [currentTargetGroup, setCurrentTargetGroup] = useState<string | null>(null);
-  const { invitedUsers, addInvitedUser, isUserInvited } = useInvitedUsers(currentTargetGroup);
+  const { getInvitedUsersForGroup, forgetInvitedUsers } = useInvitedUsers();
   const [shouldStop, setShouldStop] = useState(false);
   const stopRef = useRef(false);
   const [activeForm, setActiveForm] = useState<'group' | 'phone'>('group');
+  // The background invite job shown in the progress view, if any
+  const [inviteJobId, setInviteJobId] = useState<string | null>(null);
+  const { progress: inviteJob, resume: resumeInviteJob } = useInviteJob(
+    sessionId,
+    inviteJobId,
+    (index, status) => setParticipants(prev => prev.map((p, i) => (i === index ? { ...p, status } : p)))
+  );
+
+  useEffect(() => {
+    if (!inviteJob) return;
+    setStats({
+      total: inviteJob.total,
+      invited: inviteJob.counts.invited,
+      skipped: inviteJob.counts.skipped + inviteJob.counts.failed,
+    });
+  }, [inviteJob]);
+
+  const handleResumeInviteJob = async () => {
+    try {
+      await resumeInviteJob();
+      setStatus({ message: 'Background invite resumed.', type: 'success' });
+    } catch (error) {
+      setStatus({ message: (error as Error).message, type: 'error' });
+    }
+  };
 
   const handleFormSubmit = async (formData: {
     apiId: string;
@@ -51,12 +81,19 @@ export default function Home() {
   }) => {
     try {
       setStatus({ message: 'Connecting to Telegram...', type: 'info' });
-      const result = await telegramService.connect(formData);
+      const resumeToken = localStorage.getItem(resumeTokenKey(formData.phoneNumber)) || undefined;
+      const result = await telegramService.connect({ ...formData, resumeToken });
       
       if (result.sessionId) {
         setSessionId(result.sessionId);
         setConnectionData(formData);
-        setShowVerificationForm(true);
+        if (result.resumeToken) {
+          // The saved session was reused, no login code needed
+          localStorage.setItem(resumeTokenKey(formData.phoneNumber), result.resumeToken);
+          setIsConnected(true);
+        } else {
+          setShowVerificationForm(true);
+        }
       }
       
       setStatus({ message: result.message, type: 'info' });
@@ -78,6 +115,9 @@ export default function Home() {
         code,
         sessionId
       });
+      if (result.resumeToken) {
+        localStorage.setItem(resumeTokenKey(connectionData.phoneNumber), result.resumeToken);
+      }
       
       setStatus({ message: result.message, type: 'success' });
       setIsConnected(true);
@@ -100,6 +140,7 @@ export default function Home() {
     try {
       setIsProcessing(true);
       stopRef.current = false;
+      setInviteJobId(null);
       setCurrentTargetGroup(data.targetGroup);
       setStatus({ message: 'Getting eligible participants...', type: 'info' });
       
@@ -107,11 +148,13 @@ export default function Home() {
         sourceGroups: data.sourceGroups,
         targetGroup: data.targetGroup,
         sessionId: sessionId,
-        previouslyInvited: invitedUsers,
         maxPerGroup: data.maxPerGroup,
         delayRange: data.delayRange,
-        maxMessages: data.maxMessages
+        maxMessages: data.maxMessages,
+        previouslyInvited: getInvitedUsersForGroup(data.targetGroup)
       });
+      // The server has added them to its invite ledger
+      forgetInvitedUsers(data.targetGroup);
 
       setParticipants(result.participants.map((p: Participant) => ({ 
         ...p,
@@ -139,7 +182,6 @@ export default function Home() {
             p.id === participant.id ? { ...p, status: 'invited' } : p
           ));
           setStats(prev => ({ ...prev, invited: prev.invited + 1 }));
-          addInvitedUser({ id: participant.id }, data.targetGroup);
 
           if (stopRef.current) break;
 
@@ -158,7 +200,6 @@ export default function Home() {
             p.id === participant.id ? { ...p, status: 'failed' } : p
           ));
           setStats(prev => ({ ...prev, skipped: prev.skipped + 1 }));
-          addInvitedUser({ id: participant.id }, data.targetGroup);
 
           // Wait for a random delay before next attempt
           const delayMs = Math.floor(Math.random() * (data.delayRange.max - data.delayRange.min + 1) + data.delayRange.min) * 1000;
@@ -199,22 +240,24 @@ export default function Home() {
         sourceGroups: data.sourceGroups,
         targetGroup: data.targetGroup,
         sessionId: sessionId,
-        previouslyInvited: invitedUsers,
         maxPerGroup: data.maxPerGroup,
         delayRange: data.delayRange,
-        maxMessages: data.maxMessages
+        maxMessages: data.maxMessages,
+        previouslyInvited: getInvitedUsersForGroup(data.targetGroup)
       });
+      // The server has added them to its invite ledger
+      forgetInvitedUsers(data.targetGroup);
+
+      setParticipants(result.participants.map((p: Participant) => ({ ...p, status: 'pending' })));
+      setStats({ total: result.participants.length, invited: 0, skipped: 0 });
 
-      result.participants.forEach(participant => {
-        addInvitedUser({ id: participant.id }, data.targetGroup);
-      });
-      
       // Start background invite process
-      telegramService.startBackgroundInvite({
+      const started = await telegramService.startBackgroundInvite({
         sessionId,
         delayRange: data.delayRange,
         participants: result.participants
       });
+      setInviteJobId(started.jobId);
 
       setStatus({ 
         message: 'Background invite process started. You can close this window.', 
@@ -253,6 +296,13 @@ export default function Home() {
         delayRange: data.delayRange
       });
 
+      if (result.jobId) {
+        // Numbers that could not be looked up already come back as failed
+        setParticipants(result.participants);
+        setStats({ total: result.participants.length, invited: 0, skipped: 0 });
+        setInviteJobId(result.jobId);
+      }
+
       setStatus({ 
         message: result.message, 
         type: 'success' 
@@ -275,6 +325,7 @@ export default function Home() {
     try {
       setIsProcessing(true);
       stopRef.current = false;
+      setInviteJobId(null);
       setCurrentTargetGroup(data.targetGroup);
       setStatus({ message: 'Processing phone numbers...', type: 'info' });
       
@@ -323,9 +374,6 @@ export default function Home() {
             p.id === participant.id ? { ...p, status: 'invited' } : p
           ));
           setStats(prev => ({ ...prev, invited: prev.invited + 1 }));
-          if (participant.id) {
-            addInvitedUser({ id: participant.id }, data.targetGroup);
-          }
 
           if (stopRef.current) break;
 
@@ -344,9 +392,6 @@ export default function Home() {
             p.id === participant.id ? { ...p, status: 'failed' } : p
           ));
           setStats(prev => ({ ...prev, skipped: prev.skipped + 1 }));
-          if (participant.id) {
-            addInvitedUser({ id: participant.id }, data.targetGroup);
-          }
 
           // Wait for a random delay before next attempt
           const delayMs = Math.floor(Math.random() * (data.delayRange.max - data.delayRange.min + 1) + data.delayRange.min) * 1000;
@@ -474,7 +519,12 @@ export default function Home() {
                   </div>
                 )}
                 {participants.length > 0 && (
-                  <InviteProgress participants={participants as any} stats={stats} />
+                  <InviteProgress
+                    participants={participants as any}
+                    stats={stats}
+                    job={inviteJob}
+                    onResume={handleResumeInviteJob}
+                  />
                 )}
               </>
             )}
@@ -7,6 +7,8 @@ export interface Participant {
   username: string | null;
   phone: string | null;
   status: 'pending' | 'invited' | 'failed';
+  // Why a phone number could not be looked up
+  error?: string;
 }
 
 export interface TargetGroup {
@@ -14,10 +16,21 @@ export interface TargetGroup {
   isChannel: boolean;
 }
 
+export interface GroupStats {
+  group: string;
+  scanned: number;
+  eligible: number;
+  // Eligible users found in no other source group
+  unique: number;
+  // Eligible users shared with each other source group
+  overlap: Record<string, number>;
+}
+
 export interface GetParticipantsResponse {
   success: boolean;
   message: string;
   participants: Participant[];
+  groups: GroupStats[];
   targetGroup: TargetGroup;
 }
 
@@ -31,6 +44,37 @@ interface DelayRange {
   max: number;
 }
 
+export type InviteState = 'queued' | 'resolving' | 'inviting' | 'invited' | 'skipped' | 'failed';
+
+export interface InviteEvent {
+  seq?: number;
+  index: number;
+  id: number | null;
+  state: InviteState;
+  reason: string | null;
+}
+
+export interface InviteJobSummary {
+  jobId: string;
+  sessionId: string;
+  total: number;
+  counts: Record<InviteState, number>;
+  finished: boolean;
+  status: 'running' | 'finished' | 'stopped' | 'interrupted';
+  paused: boolean;
+  elapsed: number;
+  // Participants per minute, and seconds left at that rate
+  throughput: number;
+  eta: number | null;
+  seq: number;
+}
+
+export interface InviteJobStatus extends InviteJobSummary {
+  success: boolean;
+  events: InviteEvent[];
+  participants?: InviteEvent[];
+}
+
 export class TelegramService {
   async connect(data: {
     apiId: string;
@@ -38,6 +82,8 @@ export class TelegramService {
     phoneNumber: string;
     code?: string;
     sessionId?: string;
+    // Returned by an earlier login; reuses its saved session
+    resumeToken?: string;
   }) {
     try {
       const response = await axios.post('/api/connect', data, {
@@ -57,7 +103,9 @@ export class TelegramService {
     sourceGroups: string[];
     targetGroup: string;
     sessionId: string;
-    previouslyInvited: InvitedUser[];
+    // Invite history older versions kept in the browser; the server adds it
+    // to its own ledger
+    previouslyInvited?: InvitedUser[];
     maxPerGroup: number;
     delayRange: DelayRange;
     maxMessages: number;
@@ -114,6 +162,37 @@ export class TelegramService {
       throw error.response ? error.response.data : error;
     }
   }
+
+  async getInviteStatus(data: {
+    sessionId: string;
+    jobId?: string;
+    // Only return state changes after this sequence number
+    after?: number;
+    includeParticipants?: boolean;
+  }): Promise<InviteJobStatus> {
+    try {
+      const response = await axios.post('/api/inviteStatus', data);
+      return response.data;
+    } catch (error: any) {
+      console.error('Error getting invite status:', error);
+      throw error.response ? error.response.data : error;
+    }
+  }
+
+  async resumeInterruptedJobs(data: { sessionId: string; jobId?: string }) {
+    try {
+      const response = await axios.post('/api/resumeInterruptedJobs', data);
+      return response.data;
+    } catch (error: any) {
+      console.error('Error resuming invite jobs:', error);
+      throw error.response ? error.response.data : error;
+    }
+  }
+
+  inviteEvents(sessionId: string, jobId: string): EventSource {
+    const params = new URLSearchParams({ sessionId, jobId });
+    return new EventSource(`/api/inviteEvents?${params}`);
+  }
 }
 
 export const telegramService = new TelegramService();
\ No newline at end of file